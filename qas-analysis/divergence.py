@@ -6,27 +6,83 @@ import numpy as np
 
 import matplotlib.pyplot as plt
 from matplotlib.ticker import PercentFormatter
+from multiprocessing import Pool
 import sys
 
+from lexical_variation import compute_lexical_variations
+from parse_cache import ParseCache
 
-def get_french_distances(dataset_fn):
+
+# Worker-side parse cache of the spaCy model, loaded once per process by _init_worker
+_parse_cache = None
+
+
+def _init_worker(model_name, parse_cache_path=None):
+    global _parse_cache
+    _parse_cache = ParseCache(spacy.load(model_name), parse_cache_path)
+
+
+def _compute_chunk(chunk):
+    """
+    Parses the questions and the answer sentences of a chunk of (question, sentence, span) in batches and returns
+    the (distance, lexical_variation) of each one, or None if get_anchor_docs failed. Each distinct text is only
+    parsed once, as many questions share the same answer sentence.
+    """
+    docs_questions = _parse_cache.pipe([question for question, _, _ in chunk])
+    docs_answers = _parse_cache.pipe([sentence for _, sentence, _ in chunk])
+    results = []
+    for (_, _, span), doc_question, doc_answer in zip(chunk, docs_questions, docs_answers):
+        try:
+            results.append(get_anchor_docs(doc_question, doc_answer, span))
+        except:
+            results.append(None)
+    return results
+
+
+def get_sentence_pipeline():
     pipeline = French()
     sentencizer = pipeline.create_pipe('sentencizer')
     pipeline.add_pipe(sentencizer)
+    return pipeline
+
+
+def get_french_lexical_variations(dataset_fn, model_name='fr_core_news_sm'):
+    # Only the lemmas are needed: no dependency parse, and each answer sentence is processed once
+    questions_list, sentences_list, _ = compute_question_sentence(dataset_fn, get_sentence_pipeline())
+
+    lexical_variations = compute_lexical_variations(questions_list, sentences_list, spacy.load(model_name))
+    empty_questions = np.isnan(lexical_variations)
+    print(int(empty_questions.sum()))
+    return lexical_variations[~empty_questions].tolist()
 
-    questions_list, sentences_list, spans_list = compute_question_sentence(dataset_fn, pipeline)
 
-    nlp_fr = spacy.load('fr_core_news_sm')
+def get_french_distances(dataset_fn, workers=1, chunk_size=1000, model_name='fr_core_news_sm', parse_cache_path=None):
+    questions_list, sentences_list, spans_list = compute_question_sentence(dataset_fn, get_sentence_pipeline())
+
+    items = list(zip(questions_list, sentences_list, spans_list))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    initargs = (model_name, parse_cache_path)
+    if workers <= 1:
+        _init_worker(*initargs)
+        chunks_results = map(_compute_chunk, chunks)
+        pool = None
+    else:
+        # spaCy 2.0 has no multiprocessing in nlp.pipe: each worker loads its own model and parses whole chunks
+        pool = Pool(workers, initializer=_init_worker, initargs=initargs)
+        chunks_results = pool.imap(_compute_chunk, chunks)
 
     all_distances = []
     error = 0
     error_anchor = 0
     no_pronoums = 0
     all_lexical_variation = []
-    for i, question in enumerate(questions_list):
-        try:
-            print(questions_list[i], sentences_list[i], spans_list[i])
-            distance, lexical_variation = get_anchor(questions_list[i], sentences_list[i], nlp_fr, spans_list[i])
+    for chunk, chunk_results in zip(chunks, chunks_results):
+        for (question, sentence, span), result in zip(chunk, chunk_results):
+            print(question, sentence, span)
+            if result is None:
+                error += 1
+                continue
+            distance, lexical_variation = result
             if distance is not None:
                 if distance == -1:
                     error_anchor += 1
@@ -35,23 +91,28 @@ def get_french_distances(dataset_fn):
                 else:
                     all_distances.append(distance)
                     all_lexical_variation.append(lexical_variation)
-        except:
-            error += 1
-            continue
+    if pool is not None:
+        pool.close()
+        pool.join()
     print(error, error_anchor, no_pronoums)
     return all_distances, all_lexical_variation
 
 
-def main(path_piaf_dataset):
-    all_distances, all_lexical_variation = get_french_distances(path_piaf_dataset)
+def main(path_piaf_dataset, workers=1, parse_cache_path=None, lexical_only=False):
+    if lexical_only:
+        all_lexical_variation = get_french_lexical_variations(path_piaf_dataset)
+    else:
+        all_distances, all_lexical_variation = get_french_distances(path_piaf_dataset, workers=workers,
+                                                                    parse_cache_path=parse_cache_path)
 
-    plt.hist(all_distances, bins=[0, 1, 2, 3, 4, 5, 6, 7, 8], weights=np.ones(len(all_distances)) / len(all_distances))
-    plt.gca().yaxis.set_major_formatter(PercentFormatter(1))
-    plt.xlabel('Syntactic divergence')
-    plt.ylabel('Percentage')
-    plt.savefig('hits_syntaxic.pdf')
+        plt.hist(all_distances, bins=[0, 1, 2, 3, 4, 5, 6, 7, 8],
+                 weights=np.ones(len(all_distances)) / len(all_distances))
+        plt.gca().yaxis.set_major_formatter(PercentFormatter(1))
+        plt.xlabel('Syntactic divergence')
+        plt.ylabel('Percentage')
+        plt.savefig('hits_syntaxic.pdf')
 
-    plt.clf()
+        plt.clf()
 
     plt.hist(all_lexical_variation, weights=np.ones(len(all_lexical_variation)) / len(all_lexical_variation))
     plt.gca().yaxis.set_major_formatter(PercentFormatter(1))
@@ -61,9 +122,13 @@ def main(path_piaf_dataset):
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage:\n python divergence.py path_piaf_dataset_json ")
+    lexical_only = '--lexical_only' in sys.argv
+    argv = [arg for arg in sys.argv if arg != '--lexical_only']
+    if len(argv) < 2:
+        print("Usage:\n python divergence.py path_piaf_dataset_json [nb_workers] [parse_cache_sqlite] [--lexical_only]")
         exit(1)
-    path_piaf_dataset = sys.argv[1]
+    path_piaf_dataset = argv[1]
+    workers = int(argv[2]) if len(argv) > 2 else 1
+    parse_cache_path = argv[3] if len(argv) > 3 else None
 
-    main(path_piaf_dataset)
+    main(path_piaf_dataset, workers, parse_cache_path, lexical_only)
@@ -1,14 +1,13 @@
-import json
 import os
-import sys
 import numpy as np
 import spacy
-import networkx
 import editdistance
-import networkx as nx
 
 import re
 
+from sentence_index import SentenceIndex
+from squad_stream import iter_articles, iter_paragraphs
+
 
 def cleanhtml(raw_html):
     cleanr = re.compile('<.*?>')
@@ -17,8 +16,6 @@ def cleanhtml(raw_html):
 
 
 def get_question_answers_sentences(dataset_fn, output_folder, pipeline, dump_answers=False):
-    with open(dataset_fn, 'r') as f:
-        dataset = json.load(f)
     total_answer = 0
     f_span = open(output_folder + 'qr.csv', 'w')
     f_sentence = open(output_folder + 'qr_sentence.csv', 'w')
@@ -27,7 +24,7 @@ def get_question_answers_sentences(dataset_fn, output_folder, pipeline, dump_ans
     except FileExistsError:
         print('Folder exitsts')
 
-    for article in dataset['data']:
+    for article in iter_articles(dataset_fn):
         # We will join the paragraphs
         article_text = ''
         article['title'] = cleanhtml(article['title'])
@@ -39,15 +36,7 @@ def get_question_answers_sentences(dataset_fn, output_folder, pipeline, dump_ans
             if not dump_answers:
                 continue
 
-            doc = pipeline(context)
-            start_sent = 0
-            start_to_sentence = {}
-            for sent in doc.sents:
-                # print(start_sent, len(sent.text))
-                end_sent = start_sent + len(sent.text) + 1
-                for i in range(start_sent, end_sent):
-                    start_to_sentence[i] = sent.text
-                    start_sent = end_sent
+            start_to_sentence = SentenceIndex(pipeline(context))
 
             for qa in paragraph['qas']:
                 question = qa['question']
@@ -74,67 +63,100 @@ def get_question_answers_sentences(dataset_fn, output_folder, pipeline, dump_ans
     print(total_answer)
 
 
-def compute_question_sentence(dataset_fn, pipeline):
-    questions_list = []
-    sentences_list = []
-    answers_list = []
-
+def iter_question_sentences(dataset_fn, pipeline):
+    """
+    Yields the (question, answer sentence, answer span) of the first answer of each question of the dataset,
+    reading it one article at a time.
+    """
     unfound_cpt = 0
 
-    with open(dataset_fn, 'r') as f:
-        dataset = json.load(f)
+    for article, paragraph in iter_paragraphs(dataset_fn):
 
-    for article in dataset['data']:
-        # We will join the paragraphs
+        start_to_sentence = SentenceIndex(pipeline(paragraph['context']))
 
-        for paragraph in article['paragraphs']:
+        for qa in paragraph['qas']:
+            question = qa['question']
+            if not qa['answers']:
+                continue
+            answer = qa['answers'][0]
 
-            doc = pipeline(paragraph['context'])
-            start_sent = 0
-            start_to_sentence = {}
-            for sent in doc.sents:
-                # print(start_sent, len(sent.text))
-                end_sent = start_sent + len(sent.text) + 1
-                for i in range(start_sent, end_sent):
-                    start_to_sentence[i] = sent.text
-                    start_sent = end_sent
+            answer_span = answer['text']
+            answer_sentence = start_to_sentence[answer['answer_start']]
 
-            for qa in paragraph['qas']:
-                question = qa['question']
-                if not qa['answers']:
-                    continue
-                answer = qa['answers'][0]
+            if answer_sentence.find(answer['text']) < 0:
+                print(question, answer)
+                unfound_cpt += 1
+                continue
+            yield question, answer_sentence, answer_span
+    print(unfound_cpt)
 
-                answer_span = answer['text']
-                answer_sentence = start_to_sentence[answer['answer_start']]
 
-                if answer_sentence.find(answer['text']) < 0:
-                    print(question, answer)
-                    unfound_cpt += 1
-                    continue
-                answers_list.append(answer_span)
-                questions_list.append(question)
-                sentences_list.append(answer_sentence)
-    print(unfound_cpt)
+def compute_question_sentence(dataset_fn, pipeline):
+    questions_list = []
+    sentences_list = []
+    answers_list = []
+
+    for question, answer_sentence, answer_span in iter_question_sentences(dataset_fn, pipeline):
+        answers_list.append(answer_span)
+        questions_list.append(question)
+        sentences_list.append(answer_sentence)
     return questions_list, sentences_list, answers_list
 
 
 def get_anchor(question, answer, nlp, span):
     # We tokenize the sentences
+    return get_anchor_docs(nlp(question), nlp(answer), span)
+
+
+class DependencyTree:
+    """
+    Dependency trees of a doc as arrays of token indices, to find the dependency path between two tokens
+    through their lowest common ancestor.
+    """
+
+    def __init__(self, doc):
+        self.heads = [token.head.i for token in doc]
+        self.deps = [token.dep_ for token in doc]
+        # Tokens that are neither attached to a head nor to a child are not part of any path
+        self.attached = [False] * len(self.heads)
+        for i, head in enumerate(self.heads):
+            if head != i:
+                self.attached[i] = True
+                self.attached[head] = True
+
+    def ancestors(self, i):
+        # The token itself, then its heads up to the root of its sentence
+        chain = [i]
+        while self.heads[chain[-1]] != chain[-1]:
+            chain.append(self.heads[chain[-1]])
+        return chain
+
+    def path(self, source, target):
+        """
+        Returns the dependency labels of the edges between source and target, each edge being labeled with the
+        dependency of its child token.
+        """
+        if not self.attached[source] or not self.attached[target]:
+            raise ValueError(f"No dependency path from token {source} to token {target}")
+        source_chain = self.ancestors(source)
+        source_positions = {token: position for position, token in enumerate(source_chain)}
+        target_chain = []
+        for token in self.ancestors(target):
+            if token in source_positions:
+                up = [self.deps[i] for i in source_chain[:source_positions[token]]]
+                down = [self.deps[i] for i in reversed(target_chain)]
+                return up + down
+            target_chain.append(token)
+        raise ValueError(f"No dependency path from token {source} to token {target}")
+
+
+def get_anchor_docs(doc_question, doc_answer, span):
     # questions_pronoums=['what', 'where', 'when', 'why', 'how', 'who', 'which']
     questions_pronoums = ['quelle', 'que', 'où', 'combien', 'quel', 'qui', 'quand', 'comment', 'quoi', 'pourquoi',
                           'Quand', 'quell']
 
-    doc_question = nlp(question)
-    doc_answer = nlp(answer)
-    tokens_questions = []
-    tokens_answers = []
-
-    for token in doc_answer:
-        tokens_answers.append(token.lemma_)
-
-    for token in doc_question:
-        tokens_questions.append(token.lemma_)
+    tokens_questions = [token.lemma_ for token in doc_question]
+    tokens_answers = set(token.lemma_ for token in doc_answer)
 
     anchors = [token for token in tokens_questions if token in tokens_answers]
 
@@ -144,136 +166,52 @@ def get_anchor(question, answer, nlp, span):
         # print("No anchor")
         return -1, lexical_variation
 
-    # Question iteration
-    qdoc_child2head_dic = {}
-    qdoc_head2child_dic = {}
+    # Index of the first token of each lemma
     qlemma_to_id = {}
-    edges_question = []
-
     pronom_question = None
     for token in doc_question:
-        # print(token.lemma_)
         if token.lemma_ in questions_pronoums:
             pronom_question = token.lemma_
-        if token.lemma_ in qlemma_to_id:
-            qlemma_to_id[token.lemma_].append('{0}-{1}'.format(token.lemma_, token.i))
-        else:
-            qlemma_to_id[token.lemma_] = ['{0}-{1}'.format(token.lemma_, token.i)]
-        # FYI https://spacy.io/docs/api/token
-        qdoc_head2child_dic['{0}-{1}'.format(token.lemma_, token.i)] = {}
-        for child in token.children:
-            child_value = '{0}-{1}'.format(child.lemma_, child.i)
-            head_value = '{0}-{1}'.format(token.lemma_, token.i)
-            qdoc_head2child_dic[head_value][child_value] = child.dep_
-
-            if child_value not in qdoc_child2head_dic:
-                qdoc_child2head_dic[child_value] = {}
-            qdoc_child2head_dic[child_value][head_value] = child.dep_
-            edges_question.append(('{0}-{1}'.format(token.lemma_, token.i),
-                                   '{0}-{1}'.format(child.lemma_, child.i)))
+        qlemma_to_id.setdefault(token.lemma_, token.i)
 
     if pronom_question is None:
-        # print(question)
-        # print(tokens_questions)
-
         return -2, lexical_variation
 
-    # Answer iteration
-    adoc_child2head_dic = {}
-    adoc_head2child_dic = {}
     alemma_to_id = {}
-    edges_answer = []
-    lemma_to_word = {}
-
     for token in doc_answer:
-        lemma_to_word['{0}-{1}'.format(token.lemma_, token.i)] = token.text
-        if token.lemma_ in alemma_to_id:
-            alemma_to_id[token.lemma_].append('{0}-{1}'.format(token.lemma_, token.i))
-        else:
-            alemma_to_id[token.lemma_] = ['{0}-{1}'.format(token.lemma_, token.i)]
-        # FYI https://spacy.io/docs/api/token
-        adoc_head2child_dic['{0}-{1}'.format(token.lemma_, token.i)] = {}
-        for child in token.children:
-            child_value = '{0}-{1}'.format(child.lemma_, child.i)
-            head_value = '{0}-{1}'.format(token.lemma_, token.i)
-            adoc_head2child_dic[head_value][child_value] = child.dep_
-
-            if child_value not in adoc_child2head_dic:
-                adoc_child2head_dic[child_value] = {}
-            adoc_child2head_dic[child_value][head_value] = child.dep_
-            adoc_head2child_dic['{0}-{1}'.format(token.lemma_, token.i)][
-                '{0}-{1}'.format(child.lemma_, child.i)] = child.dep_
-            edges_answer.append(('{0}-{1}'.format(token.lemma_, token.i),
-                                 '{0}-{1}'.format(child.lemma_, child.i)))
-
-    graph_question = nx.Graph(edges_question)
-    graph_answer = nx.Graph(edges_answer)
+        alemma_to_id.setdefault(token.lemma_, token.i)
 
     # We find the answer to be anchored to : it is the token of the answer that has no parent within the answer
     answer_to_anchor = None
-    for answer_lemma in adoc_child2head_dic:
-        if span.find(lemma_to_word[answer_lemma]) >= 0:
-            # print('found', answer_lemma)
-
-            parent = list(adoc_child2head_dic[answer_lemma].keys())[0]
-            if span.find(lemma_to_word[parent]) < 0:
-                # No parent
-                answer_to_anchor = answer_lemma
-                break
+    for token in sorted((token for token in doc_answer if token.head.i != token.i), key=lambda t: (t.head.i, t.i)):
+        if span.find(token.text) >= 0 and span.find(token.head.text) < 0:
+            answer_to_anchor = token.i
+            break
 
     if answer_to_anchor is None:
         print("Bug answer to anchor")
-        print(adoc_child2head_dic, span)
+        print([(token.text, token.head.text) for token in doc_answer], span)
         return None, lexical_variation
 
+    question_tree = DependencyTree(doc_question)
+    answer_tree = DependencyTree(doc_answer)
+
     all_edit_distances = []
     # No we iterate over the anchors to find the shortest edit distance
     for anchor in anchors:
-
-        paths = nx.shortest_path(graph_question, qlemma_to_id[pronom_question][0], qlemma_to_id[anchor][0])
-
-        final_path_question = []
-        previous_path = None
-        for path in paths:
-            if previous_path is None:
-                previous_path = path
-                continue
-            try:
-                final_path_question.append(qdoc_child2head_dic[previous_path][path])
-            except KeyError:
-                final_path_question.append(qdoc_head2child_dic[previous_path][path])
-
-            previous_path = path
-
-        # print(final_path_question)
-        paths = nx.shortest_path(graph_answer, answer_to_anchor, alemma_to_id[anchor][0])
-
-        final_path_answer = []
-        previous_path = None
-        for path in paths:
-            if previous_path is None:
-                previous_path = path
-                continue
-            try:
-                final_path_answer.append(adoc_child2head_dic[previous_path][path])
-            except KeyError:
-                final_path_answer.append(adoc_head2child_dic[previous_path][path])
-
-            previous_path = path
-
+        final_path_question = question_tree.path(qlemma_to_id[pronom_question], qlemma_to_id[anchor])
+        final_path_answer = answer_tree.path(answer_to_anchor, alemma_to_id[anchor])
         all_edit_distances.append(editdistance.eval(final_path_question, final_path_answer))
     return np.min(all_edit_distances), lexical_variation
 
 
 def get_number_paragraphs_categories(dataset_fn, by_articles=False):
-    with open(dataset_fn) as f:
-        dataset = json.load(f)
-    titles_list = []
+    titles_set = set()
     categories_dic = {}
-    for article in dataset:
-        if article['displaytitle'] in titles_list:
+    for article in iter_articles(dataset_fn):
+        if article['displaytitle'] in titles_set:
             continue
-        titles_list.append(article['displaytitle'])
+        titles_set.add(article['displaytitle'])
         if article['audience'] != 'restricted':
             print(article['displaytitle'])
             continue
@@ -290,16 +228,13 @@ def get_number_paragraphs_categories(dataset_fn, by_articles=False):
 
 
 def piaf_to_squad_eval(dataset_fn, restricted=True):
-    with open(dataset_fn) as f:
-        dataset = json.load(f)
-
     new_dataset = {}
     new_dataset['data'] = []
-    article_list = []
+    article_set = set()
     cpt = 0
     mistakes = 0
     paragraph_cpt = 0
-    for article in dataset:
+    for article in iter_articles(dataset_fn):
         new_article = {}
         if restricted:
             if article['audience'] != 'restricted':
@@ -307,9 +242,9 @@ def piaf_to_squad_eval(dataset_fn, restricted=True):
         else:
             if article['audience'] == 'restricted':
                 continue
-        if article['displaytitle'] in article_list:
+        if article['displaytitle'] in article_set:
             continue
-        article_list.append(article['displaytitle'])
+        article_set.add(article['displaytitle'])
         new_article['title'] = article['displaytitle']
         new_article['paragraphs'] = []
 
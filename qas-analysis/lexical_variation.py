@@ -0,0 +1,51 @@
+"""
+Lexical variation of all the question / answer sentence pairs of a dataset at once, without dependency parsing:
+1 - (number of question tokens whose lemma is in the answer sentence) / (number of question tokens),
+as computed by get_anchor_docs for each pair.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def lemma_matrix(docs, lemma_to_id, binary=False):
+    """
+    Returns the (data, indices, indptr) CSR arrays of the lemma counts of each doc, or of the lemmas present in
+    each doc if binary is set. Lemma ids are added to lemma_to_id as they are found.
+    """
+    indptr = [0]
+    indices = []
+    for doc in docs:
+        doc_ids = [lemma_to_id.setdefault(token.lemma_, len(lemma_to_id)) for token in doc]
+        if binary:
+            doc_ids = sorted(set(doc_ids))
+        indices.extend(doc_ids)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float64)
+    return data, np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)
+
+
+def compute_lexical_variations(questions_list, sentences_list, nlp, batch_size=1000):
+    """
+    Returns the lexical variation of each (question, answer sentence) pair, NaN for empty questions. The texts
+    are only tokenized, tagged and lemmatized, each distinct sentence once.
+    """
+    unique_sentences = list(dict.fromkeys(sentences_list))
+    sentence_rows = {sentence: row for row, sentence in enumerate(unique_sentences)}
+
+    lemma_to_id = {}
+    with nlp.disable_pipes(*[name for name in ('parser', 'ner') if name in nlp.pipe_names]):
+        questions = lemma_matrix(nlp.pipe(questions_list, batch_size=batch_size), lemma_to_id)
+        sentences = lemma_matrix(nlp.pipe(unique_sentences, batch_size=batch_size), lemma_to_id, binary=True)
+
+    # The matrices can only be shaped once all the lemmas are known
+    nb_lemmas = len(lemma_to_id)
+    questions = sparse.csr_matrix(questions, shape=(len(questions_list), nb_lemmas))
+    sentences = sparse.csr_matrix(sentences, shape=(len(unique_sentences), nb_lemmas))
+    sentences = sentences[[sentence_rows[sentence] for sentence in sentences_list]]
+
+    # Duplicated question tokens are counted as many times as they appear, as in get_anchor_docs
+    anchors = np.asarray(questions.multiply(sentences).sum(axis=1)).ravel()
+    lengths = np.asarray(questions.sum(axis=1)).ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - anchors / lengths
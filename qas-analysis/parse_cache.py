@@ -0,0 +1,90 @@
+"""
+Cache of the spaCy parses of the questions and answer sentences, keyed by their text.
+
+The most recently used docs are kept in memory, and all of them can also be stored in a sqlite database so that
+the next analysis runs do not parse them again. spaCy 2.0 does not serialize the strings of a doc with it, so
+the strings of its tokens are stored next to doc.to_bytes() and added to the vocab before loading it back.
+"""
+
+import pickle as pkl
+import sqlite3
+from collections import OrderedDict
+
+from spacy.tokens import Doc
+
+
+def model_name(nlp):
+    return '{}_{}-{}'.format(nlp.meta.get('lang'), nlp.meta.get('name'), nlp.meta.get('version'))
+
+
+class ParseCache:
+    def __init__(self, nlp, cache_path=None, max_size=10000, batch_size=1000):
+        self.nlp = nlp
+        self.model = model_name(nlp)
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.docs = OrderedDict()
+        self.connection = None
+        if cache_path is not None:
+            # Shared by the worker processes of divergence.py
+            self.connection = sqlite3.connect(cache_path, timeout=60)
+            with self.connection:
+                self.connection.execute("CREATE TABLE IF NOT EXISTS docs (model TEXT NOT NULL, text TEXT NOT NULL, "
+                                        "doc BLOB NOT NULL, PRIMARY KEY (model, text))")
+
+    def _remember(self, text, doc):
+        self.docs[text] = doc
+        self.docs.move_to_end(text)
+        if len(self.docs) > self.max_size:
+            self.docs.popitem(last=False)
+
+    def _load(self, text):
+        row = self.connection.execute("SELECT doc FROM docs WHERE model = ? AND text = ?",
+                                      (self.model, text)).fetchone()
+        if row is None:
+            return None
+        doc_bytes, strings = pkl.loads(row[0])
+        for string in strings:
+            self.nlp.vocab.strings.add(string)
+        return Doc(self.nlp.vocab).from_bytes(doc_bytes)
+
+    def _store(self, parsed):
+        records = []
+        for text, doc in parsed.items():
+            strings = {string for token in doc for string in (token.lemma_, token.tag_, token.dep_, token.ent_type_)}
+            records.append((self.model, text, pkl.dumps((doc.to_bytes(), sorted(strings)))))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?)", records)
+
+    def get(self, text):
+        """
+        Returns the cached doc of a text, or None if it was never parsed.
+        """
+        doc = self.docs.get(text)
+        if doc is None and self.connection is not None:
+            doc = self._load(text)
+        if doc is not None:
+            self._remember(text, doc)
+        return doc
+
+    def pipe(self, texts):
+        """
+        Returns the docs of texts, in the same order. Texts that are not cached are parsed once each, in batches.
+        """
+        docs = [self.get(text) for text in texts]
+        missing = list(OrderedDict.fromkeys(text for text, doc in zip(texts, docs) if doc is None))
+        parsed = OrderedDict()
+        if missing:
+            parsed.update(zip(missing, self.nlp.pipe(missing, batch_size=self.batch_size)))
+        if parsed and self.connection is not None:
+            self._store(parsed)
+        for text, doc in parsed.items():
+            self._remember(text, doc)
+        return [doc if doc is not None else parsed[text] for text, doc in zip(texts, docs)]
+
+    def __call__(self, text):
+        return self.pipe([text])[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
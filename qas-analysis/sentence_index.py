@@ -0,0 +1,31 @@
+from bisect import bisect_right
+
+
+class SentenceIndex:
+    """
+    Maps a character offset of a parsed text to the text of its sentence, by a binary search over the sorted
+    start offsets of the sentences.
+    """
+
+    def __init__(self, doc):
+        self.starts = []
+        self.sentences = []
+        for sent in doc.sents:
+            self.starts.append(sent.start_char)
+            self.sentences.append(sent.text)
+        self.length = len(doc.text)
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def __getitem__(self, char_offset):
+        if not self.sentences or not 0 <= char_offset < self.length:
+            raise KeyError(char_offset)
+        # Leading whitespace before the first sentence belongs to it
+        return self.sentences[max(bisect_right(self.starts, char_offset) - 1, 0)]
+
+    def get(self, char_offset, default=None):
+        try:
+            return self[char_offset]
+        except KeyError:
+            return default
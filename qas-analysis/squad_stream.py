@@ -0,0 +1,119 @@
+"""
+Incremental reading of SQuAD-like datasets ({"data": [article, ...], ...}) and of PIAF annotation exports
+([article, ...]), one article at a time, so that the memory used does not depend on the size of the file.
+"""
+
+import json
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+
+_decoder = json.JSONDecoder()
+
+
+class _JsonStream:
+    """
+    Text buffer over a JSON file, refilled with larger and larger chunks when a value does not fit in it.
+    """
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Returns the next non-whitespace character, or '' at the end of the file
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text) or not self.fill(self.chunk_size):
+                return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at character {self.pos} of the buffer, got {self.peek()!r}")
+        self.pos += 1
+
+    def decode(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # A number cut by the end of the buffer may have been decoded as a shorter one
+                if self.eof or (end < len(self.text) and self.text[end] in _DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(size)
+            size *= 2
+
+    def iter_array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
+
+
+def iter_articles(dataset_fn, key='data'):
+    """
+    Yields the articles of the dataset_fn JSON file: the items of its key array if it is an object,
+    or its own items if it is an array.
+    """
+    with open(dataset_fn, encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        if stream.peek() == '[':
+            yield from stream.iter_array()
+            return
+
+        stream.expect('{')
+        while stream.peek() != '}':
+            name = stream.decode()
+            stream.expect(':')
+            if name == key:
+                yield from stream.iter_array()
+                return
+            stream.decode()
+            if stream.peek() == ',':
+                stream.pos += 1
+        raise KeyError(f"No {key!r} array in {dataset_fn}")
+
+
+def iter_paragraphs(dataset_fn, key='data'):
+    """
+    Yields the (article, paragraph) pairs of a SQuAD-like dataset.
+    """
+    for article in iter_articles(dataset_fn, key):
+        for paragraph in article['paragraphs']:
+            yield article, paragraph
+
+
+def iter_qas(dataset_fn, key='data'):
+    """
+    Yields the (article, paragraph, qa) triples of a SQuAD-like dataset.
+    """
+    for article, paragraph in iter_paragraphs(dataset_fn, key):
+        for qa in paragraph['qas']:
+            yield article, paragraph, qa
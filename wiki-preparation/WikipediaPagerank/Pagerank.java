@@ -116,6 +116,24 @@ final class Pagerank {
 	
 	/*---- Methods ----*/
 	
+	// Replaces the current PageRank values by the given previous ones (e.g. computed on an older dump).
+	// Pages that became active since then get the uniform weight, and the values are normalized again.
+	public void warmStart(double[] prevPageranks) {
+		double sum = 0;
+		for (int i = 0; i < idLimit; i++) {
+			if (!isActive[i])
+				pageranks[i] = 0;
+			else if (i < prevPageranks.length && prevPageranks[i] > 0)
+				pageranks[i] = prevPageranks[i];
+			else
+				pageranks[i] = 1.0 / numActive;
+			sum += pageranks[i];
+		}
+		for (int i = 0; i < idLimit; i++)
+			pageranks[i] /= sum;
+	}
+	
+	
 	// Performs one iteration of the PageRank algorithm and updates the values in the array 'pageranks'.
 	public void iterateOnce(double damping) {
 		// Pre-divide by number of outgoing links
@@ -25,9 +25,12 @@
  *
  */
 
+import java.io.BufferedInputStream;
 import java.io.BufferedOutputStream;
+import java.io.DataInputStream;
 import java.io.DataOutputStream;
 import java.io.File;
+import java.io.FileInputStream;
 import java.io.FileOutputStream;
 import java.io.IOException;
 import java.util.Arrays;
@@ -60,13 +63,15 @@ public final class WikipediaPagerank {
 	public static void main(String[] args) throws IOException {
         if (args.length < 3)
 		{
-			System.out.println("Usage: \n java WikipediaPagerank path_wiki_page.sql.gz path_wiki_pagelinks.sql.gz nb_iterations");
+			System.out.println("Usage: \n java WikipediaPagerank path_wiki_page.sql.gz path_wiki_pagelinks.sql.gz nb_iterations [tolerance [previous_wikipedia-pageranks.raw]]");
 			System.exit(0);
 		}
 		
 		File PAGE_ID_TITLE_SQL_FILE = new File(args[0]);           // Original input file 
 		File PAGE_LINKS_SQL_FILE = new File(args[1]);   // Original input file
 		int nb_iter = Integer.parseInt(args[2]);
+		double tolerance = args.length > 3 ? Double.parseDouble(args[3]) : 0;  // Stop when the L1 change is below it, 0 to always do nb_iter iterations
+		File warmStartFile = args.length > 4 ? new File(args[4]) : null;  // PageRanks of a previous run to start from
 
 		// Read page-ID-title data
 		Map<String,Integer> titleToId;
@@ -89,6 +94,8 @@ public final class WikipediaPagerank {
 		final double DAMPING = 0.85;  // Between 0.0 and 1.0; standard value is 0.85
 		System.out.println("Computing PageRank...");
 		Pagerank pr = new Pagerank(links);
+		if (warmStartFile != null)
+			pr.warmStart(readPageranks(warmStartFile));
 		double[] prevPageranks = pr.pageranks.clone();
 		for (int i = 0; i < nb_iter; i++) {
 			// Do iteration
@@ -101,6 +108,12 @@ public final class WikipediaPagerank {
 			double[] pageranks = pr.pageranks;
 			printPagerankChangeRatios(prevPageranks, pageranks);
 			printTopPages(pageranks, idToTitle);
+			double delta = computeL1Change(prevPageranks, pageranks);
+			System.out.println("L1 change: " + delta);
+			if (delta < tolerance) {
+				System.out.println("Converged after " + (i + 1) + " iterations");
+				break;
+			}
 			prevPageranks = pageranks.clone();
 		}
 		
@@ -117,6 +130,27 @@ public final class WikipediaPagerank {
 	
 	/*---- Miscellaneous functions ----*/
 	
+	private static double[] readPageranks(File file) throws IOException {
+		double[] result = new double[(int)(file.length() / 8)];
+		DataInputStream in = new DataInputStream(new BufferedInputStream(new FileInputStream(file), 128 * 1024));
+		try {
+			for (int i = 0; i < result.length; i++)
+				result[i] = in.readDouble();
+		} finally {
+			in.close();
+		}
+		return result;
+	}
+	
+	
+	private static double computeL1Change(double[] prevPr, double[] pr) {
+		double sum = 0;
+		for (int i = 0; i < pr.length; i++)
+			sum += Math.abs(pr[i] - prevPr[i]);
+		return sum;
+	}
+	
+	
 	private static void printPagerankChangeRatios(double[] prevPr, double[] pr) {
 		double min = Double.POSITIVE_INFINITY;
 		double max = 0;
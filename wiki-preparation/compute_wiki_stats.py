@@ -7,36 +7,57 @@ import argparse
 from wikipediaapi import Wikipedia
 from tqdm import tqdm
 from os import listdir
+from multiprocessing import Pool
 
+from corpus_store import CorpusStore
+from sections import END_SECTION_TITLES, get_section_text
+from stats_cache import StatsCache, page_signature
 
-# We want to save the articles stats
 
-def get_section_text(section, level=1):
-    s_text = ''
-    for s in section.sections:
-        s_text += s.text
-        s_text += '\n' + get_section_text(s, level + 1)
-    return s_text
+# Worker-side sources of the pages, set once per process by _init_worker
+_folder_path = None
+_html_path = None
+_corpus = None
 
+# We want to save the articles stats
 
 def compute_article(wiki_path, html_path):
-    stats = {}
     wiki_path = wiki_path.replace(' ', '_')
-    html_path = html_path.replace(' ', '_')
 
     with open(wiki_path, 'rb') as f:
         page = pkl.load(f)
 
+    page_html = None
     if html_path is not None:
+        html_path = html_path.replace(' ', '_')
         with open(html_path, 'rb') as f:
             page_html = pkl.load(f)
+    return compute_page(page, page_html, wiki_path)
+
+
+def compute_corpus_article(corpus, key):
+    # The html record of a key can be stored without its wiki one by an interrupted dump
+    if not corpus.has(key, 'wiki'):
+        print(key)
+        print('MissingError')
+        return 'MissingError'
+    page_html = corpus.page(key, 'html') if corpus.has(key, 'html') else None
+    return compute_page(corpus.page(key, 'wiki'), page_html, key)
+
+
+def compute_page(page, page_html=None, name=None):
+    stats = {}
     try:
         stats['total_text_length'] = len(page.text)
     except:
-        print(wiki_path)
+        print(name)
         print('TextError')
         return 'TextError'
 
+    # Kept with the paragraphs so that the articles can be exported from the stats alone
+    stats['title'] = page.title
+    stats['lastrevid'] = page.lastrevid
+
     stats['draft_in_category'] = False
     stats['homonym_in_category'] = False
 
@@ -71,29 +92,14 @@ def compute_article(wiki_path, html_path):
 
     try:
         for i, section in enumerate(page.sections):
-            if section.title in ['Voir aussi', 'Articles connexes', 'Liens externes', 'Notes et références']:
+            if section.title in END_SECTION_TITLES:
                 break
             if section.title == 'Événements':
                 stats['is_a_year_article'] = True
 
-            # We check if the section contains lists 
-
-            if html_path is not None:
-                if '<li>' in page_html.sections[i].text:
-                    current_section_text = ''
-                else:
-                    current_section_text = section.text + '\n'
-
-                new_html_section_text = get_section_text(page_html.sections[i])
-
-                if '<li>' in new_html_section_text:
-                    new_section_text = ''
-                else:
-                    new_section_text = get_section_text(section)
-
-                section_text = current_section_text + new_section_text
-            else:
-                section_text = section.text + '\n' + get_section_text(section)
+            # We check if the section contains lists
+            section_html = page_html.sections[i] if page_html is not None else None
+            section_text = get_section_text(section, section_html)
 
             stats['sections_length'].append(len(section_text))
 
@@ -108,38 +114,99 @@ def compute_article(wiki_path, html_path):
     return stats
 
 
-def compute_files(wiki_path_list, folder_path, html_path):
-    if html_path is not None:
-        stats_dic = {wiki_path: compute_article(folder_path + '/' + wiki_path, html_path + '/' + wiki_path) for
-                     wiki_path in tqdm(wiki_path_list)}
-    else:
-        stats_dic = {wiki_path: compute_article(folder_path + '/' + wiki_path, None) for wiki_path in
-                     tqdm(wiki_path_list)}
-    return stats_dic
+def _init_worker(folder_path, html_path, corpus_path):
+    global _folder_path, _html_path, _corpus
+    _folder_path = folder_path
+    _html_path = html_path
+    _corpus = CorpusStore(corpus_path) if corpus_path is not None else None
+
+
+def _compute_key(key):
+    if _corpus is not None:
+        return compute_corpus_article(_corpus, key)
+    html_path = _html_path + '/' + key if _html_path is not None else None
+    return compute_article(_folder_path + '/' + key, html_path)
+
+
+def compute_keys(wiki_path_list, folder_path, html_path, corpus_path=None, workers=1):
+    """
+    Returns the stats of every page of wiki_path_list, keyed as in the list. With several workers, the pages
+    are distributed by chunks to a pool of processes and the results are collected in the order of the list.
+    """
+    initargs = (folder_path, html_path, corpus_path)
+    if workers <= 1:
+        _init_worker(*initargs)
+        return {key: _compute_key(key) for key in tqdm(wiki_path_list)}
+
+    chunksize = max(1, len(wiki_path_list) // (workers * 16))
+    with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        results = pool.imap(_compute_key, wiki_path_list, chunksize=chunksize)
+        return {key: stats for key, stats in zip(wiki_path_list, tqdm(results, total=len(wiki_path_list)))}
+
+
+def compute_files(wiki_path_list, folder_path, html_path, corpus_path=None, workers=1, cache_path=None):
+    """
+    Same as compute_keys, but with a stats cache only the pages that are new or changed since the last run, or
+    whose stats failed, are computed; the stats of the other ones are read from the cache at once.
+    """
+    if cache_path is None:
+        return compute_keys(wiki_path_list, folder_path, html_path, corpus_path, workers)
+
+    corpus = CorpusStore(corpus_path) if corpus_path is not None else None
+    signatures = {key: page_signature(key, folder_path, html_path, corpus) for key in wiki_path_list}
+    with StatsCache(cache_path) as cache:
+        stale_keys = cache.stale_keys(signatures)
+        print(f"Computing the stats of {len(stale_keys)} new or changed articles out of {len(wiki_path_list)}")
+        computed = compute_keys(stale_keys, folder_path, html_path, corpus_path, workers)
+        # Error sentinels ('TextError', ...) are not cached, so that they are computed again on the next run
+        cache.update({key: stats for key, stats in computed.items() if isinstance(stats, dict)}, signatures)
+        cached = cache.get_many(key for key in wiki_path_list if key not in computed)
+        return {key: computed[key] if key in computed else cached[key] for key in wiki_path_list}
 
 
 def get_pkl_filenames_from_folder(folder_path):
-    list_files = [f for f in listdir(folder_path) if '.pkl' in f]
+    list_files = [f for f in listdir(folder_path) if f.endswith('.pkl')]
     return list_files
 
 
+def get_corpus_keys(corpus_path):
+    # Same as the pickle files of the wiki pages folder: the keys with a wiki record
+    corpus = CorpusStore(corpus_path)
+    return [key for key in corpus.keys() if corpus.has(key, 'wiki')]
+
+
 def main():
     parser = argparse.ArgumentParser()
     ## Required parameters
-    parser.add_argument("--folder_path", default=None, type=str, required=True,
+    parser.add_argument("--folder_path", default=None, type=str, required=False,
                         help="Path where the pages are saved")
 
+    parser.add_argument("--corpus_path", default=None, type=str, required=False,
+                        help="Corpus store where the pages are saved, instead of --folder_path and --html_path")
+
     parser.add_argument("--html_path", default=None, type=str, required=False,
                         help="Path where the html pages are saved")
 
     parser.add_argument("--output_dic_fn", default=None, type=str, required=True,
                         help="Pkl file where the stats will be dumped")
 
+    parser.add_argument("--workers", default=1, type=int, required=False,
+                        help="Number of processes computing the stats")
+
+    parser.add_argument("--cache_path", default=None, type=str, required=False,
+                        help="Sqlite stats cache, to only compute the stats of new or changed articles")
+
     args = parser.parse_args()
 
-    wiki_path_list = get_pkl_filenames_from_folder(args.folder_path)
+    if args.corpus_path is not None:
+        wiki_path_list = get_corpus_keys(args.corpus_path)
+    elif args.folder_path is not None:
+        wiki_path_list = get_pkl_filenames_from_folder(args.folder_path)
+    else:
+        parser.error("one of --folder_path or --corpus_path is required")
 
-    stats_dic = compute_files(wiki_path_list, args.folder_path, args.html_path)
+    stats_dic = compute_files(wiki_path_list, args.folder_path, args.html_path, corpus_path=args.corpus_path,
+                              workers=args.workers, cache_path=args.cache_path)
 
     with open(args.output_dic_fn, 'wb') as f:
         pkl.dump(stats_dic, f)
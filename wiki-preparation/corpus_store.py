@@ -0,0 +1,274 @@
+"""
+Single-file store of the dumped articles, replacing the one-pickle-per-article folders.
+
+The records file is append-only: each record holds one article in one extract format ('wiki' or 'html') as a
+small JSON header giving the position of every field, followed by the fields, each one encoded separately in
+JSON. The index file lists, one line per record, "key<TAB>format<TAB>offset"; the last record of a key and
+format wins, so that updated articles are simply appended. Readers memory-map the records file and only
+decode the fields they access.
+"""
+
+import argparse
+import json
+import mmap
+import pickle as pkl
+import struct
+import threading
+from os import listdir, path
+
+from tqdm import tqdm
+
+FORMATS = ('wiki', 'html')
+INDEX_SUFFIX = '.idx'
+
+_HEADER_LENGTH = struct.Struct('>I')
+
+
+def page_key(title):
+    # Same name as the pickle files written by dump.py, without the extension
+    return title.replace(' ', '_').replace("/", "__SLASH__")
+
+
+def flatten_sections(sections, depth=0):
+    """
+    Pre-order list of [depth, level, title, text] of a section tree.
+    """
+    flat = []
+    for section in sections:
+        flat.append([depth, section.level, section.title, section.text])
+        flat.extend(flatten_sections(section.sections, depth + 1))
+    return flat
+
+
+def read_index(index_path):
+    """
+    Returns the (key, format, offset) lines of an index file and the size in bytes of these lines. A last line
+    cut by an interrupted CorpusWriter (without its new line or some of its fields) is left out.
+    """
+    with open(index_path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    # The text after the last new line is empty, unless the last line was cut
+    lines.pop()
+    entries = []
+    size = 0
+    for i, line in enumerate(lines):
+        fields = line.decode('utf-8').split('\t')
+        if len(fields) != 3:
+            if i == len(lines) - 1:
+                break
+            raise ValueError(f"Malformed line {i + 1} of {index_path}: {line!r}")
+        entries.append((fields[0], fields[1], int(fields[2])))
+        size += len(line) + 1
+    return entries, size
+
+
+class CorpusWriter:
+    def __init__(self, corpus_path):
+        self.path = corpus_path
+        self._lock = threading.Lock()
+        self.stored = set()
+        index_path = corpus_path + INDEX_SUFFIX
+        if path.exists(index_path):
+            entries, size = read_index(index_path)
+            self.stored = {(key, extract_format) for key, extract_format, _ in entries}
+            # New lines are appended after the complete ones only
+            if size < path.getsize(index_path):
+                with open(index_path, 'r+b') as f:
+                    f.truncate(size)
+        self._records = open(corpus_path, 'ab')
+        self._index = open(corpus_path + INDEX_SUFFIX, 'a', encoding='utf-8')
+
+    def has(self, key, extract_format):
+        return (key, extract_format) in self.stored
+
+    def append(self, page, extract_format, key=None):
+        """
+        Appends a page (WikipediaPage or StoredPage) in the given format, 'wiki' or 'html'.
+        """
+        if extract_format not in FORMATS:
+            raise ValueError(f"Unknown format: {extract_format}")
+        fields = {'title': page.title,
+                  'lastrevid': page.lastrevid,
+                  'categories': list(page.categories),
+                  'summary': page.summary,
+                  'sections': flatten_sections(page.sections)}
+        encoded = {name: json.dumps(value, ensure_ascii=False).encode('utf-8') for name, value in fields.items()}
+        positions = {}
+        start = 0
+        for name, value in encoded.items():
+            positions[name] = [start, len(value)]
+            start += len(value)
+        header = json.dumps(positions).encode('utf-8')
+
+        key = key or page_key(page.title)
+        with self._lock:
+            offset = self._records.tell()
+            self._records.write(_HEADER_LENGTH.pack(len(header)) + header + b''.join(encoded.values()))
+            self._records.flush()
+            # The index line is only written once its record is complete
+            self._index.write(f"{key}\t{extract_format}\t{offset}\n")
+            self._index.flush()
+            self.stored.add((key, extract_format))
+
+    def close(self):
+        self._records.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StoredSection:
+    def __init__(self, level, title, text):
+        self.level = level
+        self.title = title
+        self.text = text
+        self.sections = []
+
+    def full_text(self, level=1, extract_format='wiki'):
+        # Same rendering as WikipediaPageSection.full_text
+        if extract_format == 'wiki':
+            res = self.title
+        else:
+            res = "<h{}>{}</h{}>".format(level, self.title, level)
+        res += "\n" + self.text
+        if len(self.text) > 0:
+            res += "\n\n"
+        for sec in self.sections:
+            res += sec.full_text(level + 1, extract_format)
+        return res
+
+
+class StoredPage:
+    """
+    Read-only page of a CorpusStore, with the attributes of WikipediaPage used by the pipeline.
+    Each field is only decoded when it is first accessed.
+    """
+
+    def __init__(self, store, offset, key, extract_format):
+        self.store = store
+        self.offset = offset
+        self.key = key
+        self.extract_format = extract_format
+        self._positions = None
+        self._fields_start = None
+        self._sections = None
+
+    def field(self, name):
+        if self._positions is None:
+            self._positions, self._fields_start = self.store.read_header(self.offset)
+        start, length = self._positions[name]
+        start += self._fields_start
+        return json.loads(self.store.data[start:start + length].decode('utf-8'))
+
+    @property
+    def title(self):
+        return self.field('title')
+
+    @property
+    def lastrevid(self):
+        return self.field('lastrevid')
+
+    @property
+    def categories(self):
+        return self.field('categories')
+
+    @property
+    def summary(self):
+        return self.field('summary')
+
+    @property
+    def sections(self):
+        if self._sections is None:
+            root = StoredSection(0, '', '')
+            stack = [root]
+            for depth, level, title, text in self.field('sections'):
+                section = StoredSection(level, title, text)
+                del stack[depth + 1:]
+                stack[-1].sections.append(section)
+                stack.append(section)
+            self._sections = root.sections
+        return self._sections
+
+    @property
+    def text(self):
+        # Same rendering as WikipediaPage.text
+        txt = self.summary
+        if len(txt) > 0:
+            txt += "\n\n"
+        for sec in self.sections:
+            txt += sec.full_text(2, self.extract_format)
+        return txt.strip()
+
+
+class CorpusStore:
+    def __init__(self, corpus_path):
+        self.path = corpus_path
+        self.offsets = {}
+        for key, extract_format, offset in read_index(corpus_path + INDEX_SUFFIX)[0]:
+            self.offsets.setdefault(key, {})[extract_format] = offset
+        with open(corpus_path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if path.getsize(corpus_path) else b''
+
+    def read_header(self, offset):
+        header_length = _HEADER_LENGTH.unpack_from(self.data, offset)[0]
+        header_start = offset + _HEADER_LENGTH.size
+        positions = json.loads(self.data[header_start:header_start + header_length].decode('utf-8'))
+        return positions, header_start + header_length
+
+    def keys(self):
+        return list(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def has(self, key, extract_format):
+        return extract_format in self.offsets.get(key, {})
+
+    def page(self, key, extract_format='wiki'):
+        try:
+            offset = self.offsets[key][extract_format]
+        except KeyError:
+            raise KeyError(f"{key} ({extract_format}) is not in {self.path}")
+        return StoredPage(self, offset, key, extract_format)
+
+
+def convert_folders(wiki_path, html_path, corpus_path):
+    """
+    Converts the pickle folders written by dump.py into a corpus store.
+    """
+    with CorpusWriter(corpus_path) as writer:
+        for folder, extract_format in [(wiki_path, 'wiki'), (html_path, 'html')]:
+            if folder is None:
+                continue
+            for filename in tqdm([f for f in listdir(folder) if f.endswith('.pkl')]):
+                with open(path.join(folder, filename), 'rb') as f:
+                    page = pkl.load(f)
+                writer.append(page, extract_format, key=filename[:-len('.pkl')])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("--wiki_path", default=None, type=str, required=True,
+                        help="Path where the wiki pages are saved")
+
+    parser.add_argument("--html_path", default=None, type=str, required=False,
+                        help="Path where the html pages are saved")
+
+    parser.add_argument("--output_corpus", default=None, type=str, required=True,
+                        help="Corpus store file to write, its index is written next to it")
+
+    args = parser.parse_args()
+
+    convert_folders(args.wiki_path, args.html_path, args.output_corpus)
+
+
+if __name__ == "__main__":
+    main()
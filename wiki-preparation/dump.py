@@ -1,13 +1,39 @@
 from typing import List, Union
 from random import sample
 from pathlib import Path
-from os import makedirs
-from json import JSONEncoder, dumps
+from os import makedirs, replace
+from json import JSONEncoder, dumps, loads
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tempfile import NamedTemporaryFile
 import pickle as pkl
-import sys
+import argparse
+import threading
+import time
 
+import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
 from wikipediaapi import Wikipedia, ExtractFormat
 
+from corpus_store import CorpusWriter, page_key
+
+# HTTP statuses worth retrying: rate limited or temporarily unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Maximum number of titles of a single MediaWiki API query
+MAX_TITLES_PER_QUERY = 50
+
+# Suffix of the pickles being written, renamed to their .pkl target once complete
+PARTIAL_SUFFIX = '.partial'
+
+# Index of the canonical title of the dumped pages, written next to the WIKI pages
+CANONICAL_TITLES_FILE = 'canonical_titles.json'
+
+# Same page properties as Wikipedia.info
+INFO_PROPERTIES = ['protection', 'talkid', 'watched', 'watchers', 'visitingwatchers', 'notificationtimestamp',
+                   'subjectid', 'url', 'readable', 'preload', 'displaytitle']
+
 
 class Paragraph:
     def __init__(self,
@@ -39,48 +65,401 @@ class Dataset:
         return dumps(self, indent=4, cls=self.CustomEncoder)
 
 
-def dump_page(source: str,
-              target_folder: Union[Path, str] = "pages",
-              wiki_obj: Wikipedia = None,
-              lang: str = 'fr'):
-    if not wiki_obj:
-        wiki_obj = Wikipedia(lang)
+class RateLimiter:
+    """
+    Token bucket shared by the download threads: at most `rate` requests per second on average,
+    with bursts of up to `burst` requests.
+    """
+
+    def __init__(self,
+                 rate: float,
+                 burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
 
-    target_folder = Path(target_folder)
-    if not target_folder.exists():
-        makedirs(target_folder)
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
 
-    wikipage = wiki_obj.page(source)
-    if not wikipage.exists():
-        print(f"page {source} does not exist")
 
+class ThrottledWikipedia(Wikipedia):
+    """
+    Wikipedia API client whose requests go through a shared RateLimiter and are retried with
+    exponential backoff. api_url allows to query another MediaWiki API, e.g. fake_wiki_api.py.
+    """
 
-    else:
-        page_info = wiki_obj.info(wikipage)
-        if page_info.title != wikipage.title:
-            wikipage = wiki_obj.page(page_info.title)
-        wiki_title = wikipage.title.replace(' ', '_')
-        target_file = target_folder / (wiki_title.replace("/", "__SLASH__") + ".pkl")
-        pkl.dump(wikipage, target_file.open('wb'))
+    def __init__(self,
+                 language: str = 'fr',
+                 extract_format: ExtractFormat = ExtractFormat.WIKI,
+                 api_url: str = None,
+                 rate_limiter: RateLimiter = None,
+                 max_retries: int = 5,
+                 backoff: float = 1.0,
+                 pool_size: int = 10,
+                 **kwargs):
+        super().__init__(language, extract_format=extract_format, **kwargs)
+        self.api_url = api_url
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def __reduce__(self):
+        # The dumped pages keep a reference to their Wikipedia object: they are pickled with a plain
+        # one, so that they can be loaded without this module, as before
+        return Wikipedia, (self.language, self.extract_format)
+
+    def _query(self, page, params):
+        return self._get(params, page.language)
+
+    def query_pages(self, titles: List[str], **params):
+        """
+        Runs one query for a batch of titles, following the API continuations.
+        Returns the mapping of each given title to its final title (after normalization and redirects)
+        and the mapping of final titles to their merged page data.
+        """
+        params = dict(params, action='query', titles='|'.join(titles))
+        resolved = {title: title for title in titles}
+        pages = {}
+        continuation = {}
+        while True:
+            raw = self._get(dict(params, **continuation))
+            query = raw.get('query', {})
+            normalized = {n['from']: n['to'] for n in query.get('normalized', [])}
+            redirects = {r['from']: r['to'] for r in query.get('redirects', [])}
+            for title in titles:
+                target = normalized.get(title, title)
+                resolved[title] = redirects.get(target, target)
+
+            for page in query.get('pages', {}).values():
+                merged = pages.setdefault(page['title'], {})
+                for key, value in page.items():
+                    if isinstance(value, list):
+                        merged.setdefault(key, []).extend(value)
+                    else:
+                        merged.setdefault(key, value)
+
+            if 'continue' not in raw:
+                return resolved, pages
+            continuation = raw['continue']
+
+    def extract_params(self):
+        # Same parameters as Wikipedia.extracts
+        if self.extract_format == ExtractFormat.WIKI:
+            return {'explaintext': 1, 'exsectionformat': 'wiki'}
+        return {}
+
+    def build_page(self, info, extract=None):
+        """
+        Builds a WikipediaPage from the info (with categories) and extract data of a batched query,
+        so that no further request is needed to read it.
+        """
+        page = self.page(info['title'])
+        self._build_info(info, page)
+        self._build_categories(info, page)
+        page._called['info'] = page._called['categories'] = True
+        if extract is not None:
+            self._build_extracts(dict(extract, extract=extract.get('extract', '')), page)
+            page._called['extracts'] = True
+        return page
+
+    def _get(self, params, language=None):
+        base_url = self.api_url or 'https://' + (language or self.language) + '.wikipedia.org/w/api.php'
+        params['format'] = 'json'
+        params['redirects'] = 1
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            delay = self.backoff * 2 ** attempt
+            try:
+                r = self._session.get(base_url, params=params, **self._request_kwargs)
+                if r.status_code not in RETRY_STATUSES:
+                    r.raise_for_status()
+                    try:
+                        return r.json()
+                    except ValueError as e:
+                        # A truncated body or an html error page: retried as a temporarily unavailable API
+                        error = requests.RequestException(f"Invalid JSON for {r.url}: {e}", response=r)
+                else:
+                    if r.headers.get('Retry-After', '').isdigit():
+                        delay = max(delay, int(r.headers['Retry-After']))
+                    error = requests.HTTPError(f"{r.status_code} for {r.url}", response=r)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            time.sleep(delay)
+
+
+class Manifest:
+    """
+    Append-only record of the pages already dumped in a folder (manifest.jsonl): for each source title,
+    its resolved title, lastrevid, extract format, pickle path and fetch time. The last line of a source wins.
+    """
+
+    def __init__(self,
+                 path: Union[Path, str]):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with self.path.open(encoding='utf-8') as f:
+                for line in f:
+                    # A crash may leave a truncated last line
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['source']] = entry
+
+    def get(self, source: str):
+        return self.entries.get(source)
+
+    def is_dumped(self, source: str):
+        entry = self.entries.get(source)
+        return entry is not None and (entry['path'] is None or Path(entry['path']).exists())
+
+    def record(self,
+               source: str,
+               title: str = None,
+               lastrevid: int = None,
+               extract_format: ExtractFormat = None,
+               path: Union[Path, str] = None):
+        entry = {'source': source,
+                 'title': title,
+                 'lastrevid': lastrevid,
+                 'format': extract_format.name if extract_format is not None else None,
+                 'path': str(path) if path is not None else None,
+                 'fetched_at': datetime.now(timezone.utc).isoformat()}
+        with self._lock:
+            self.entries[source] = entry
+            with self.path.open('a', encoding='utf-8') as f:
+                f.write(dumps(entry, ensure_ascii=False) + '\n')
+
+
+def write_canonical_titles(manifest: Manifest,
+                           path: Union[Path, str]):
+    """
+    Writes the {page key: canonical title} index of the pages of a manifest, for their source titles as well as
+    their resolved ones, so that the stats of duplicated pages can be merged without querying the API again.
+    """
+    titles = {}
+    for source, entry in manifest.entries.items():
+        if entry['title'] is not None:
+            titles[page_key(source)] = entry['title']
+            titles[page_key(entry['title'])] = entry['title']
+    tmp_file = Path(str(path) + '.tmp')
+    with tmp_file.open('w', encoding='utf-8') as f:
+        f.write(dumps(titles, ensure_ascii=False, indent=0, sort_keys=True))
+    replace(tmp_file, path)
 
 
-def main(path_topN_pkl):
-    wiki_html = Wikipedia('fr', extract_format=ExtractFormat.HTML)
-    wiki_page = Wikipedia('fr', extract_format=ExtractFormat.WIKI)
+def write_pickle(obj,
+                 target_file: Path):
+    """
+    Pickles obj next to target_file first, so that an interrupted run never leaves a truncated pickle.
+    Each write has its own temporary file, hidden and without the .pkl extension so that the stats never pick it up.
+    """
+    with NamedTemporaryFile(dir=target_file.parent, prefix='.' + target_file.stem + '.', suffix=PARTIAL_SUFFIX,
+                            delete=False) as f:
+        pkl.dump(obj, f)
+    replace(f.name, target_file)
+
+
+class ClaimedTitles:
+    """
+    Canonical titles already being written by a batch of the run, for each format, so that a page reached through
+    several sources (e.g. a title and its redirect) in concurrent batches is only fetched and written once.
+    """
+
+    def __init__(self):
+        self._claimed = set()
+        self._lock = threading.Lock()
+
+    def claim(self, extract_format: str, title: str):
+        with self._lock:
+            if (extract_format, title) in self._claimed:
+                return False
+            self._claimed.add((extract_format, title))
+            return True
+
+
+def remove_partial_files(folder: Union[Path, str]):
+    """
+    Removes the pickles left half-written in folder by an interrupted run.
+    """
+    # *.pkl.tmp files were left by the previous naming of the pickles being written
+    for pattern in ['.*' + PARTIAL_SUFFIX, '*.pkl.tmp']:
+        for tmp_file in Path(folder).glob(pattern):
+            tmp_file.unlink()
+
+
+def dump_batch(sources: List[str],
+               targets: List[tuple],
+               refresh: bool = False,
+               corpus: CorpusWriter = None,
+               claimed: ClaimedTitles = None):
+    """
+    Dumps a batch of at most MAX_TITLES_PER_QUERY sources for each (target_folder, wiki_obj, manifest) of targets.
+    Titles, redirects, revisions and categories are resolved for the whole batch in a single query, shared by
+    all the formats, then the extracts of the pages to (re)write are fetched in one batched query per format.
+    The pages are appended to corpus if it is given, instead of being pickled in target_folder.
+    Pages already claimed by another batch of the run are only recorded in the manifest, as 'duplicate'.
+    Returns the status of each dumped source: 'dumped', 'duplicate', 'unchanged', 'skipped' or 'missing'.
+    """
+    statuses = []
+    todo = []
+    for folder, wiki_obj, manifest in targets:
+        pending = [s for s in sources if refresh or not manifest.is_dumped(s)]
+        statuses.extend('skipped' for _ in range(len(sources) - len(pending)))
+        todo.append(pending)
+
+    queried = list(dict.fromkeys(s for pending in todo for s in pending))
+    if not queried:
+        return statuses
+
+    wiki_obj = targets[0][1]
+    resolved, infos = wiki_obj.query_pages(queried, prop='info|categories', inprop='|'.join(INFO_PROPERTIES),
+                                           cllimit='max')
+
+    for (folder, wiki_obj, manifest), pending in zip(targets, todo):
+        extract_format = wiki_obj.extract_format.name.lower()
+        if corpus is None:
+            makedirs(folder, exist_ok=True)
+        to_write = {}
+        for source in pending:
+            info = infos.get(resolved[source])
+            if info is None or 'missing' in info or 'invalid' in info:
+                print(f"page {source} does not exist")
+                manifest.record(source, extract_format=wiki_obj.extract_format)
+                statuses.append('missing')
+                continue
+            key = page_key(info['title'])
+            target_file = Path(folder) / (key + ".pkl")
+            stored = corpus.has(key, extract_format) if corpus is not None else target_file.exists()
+            entry = manifest.get(source)
+            if entry is not None and entry['lastrevid'] == info.get('lastrevid') and stored:
+                statuses.append('unchanged')
+                continue
+            to_write.setdefault(info['title'], []).append((source, key, target_file))
+
+        for title in list(to_write):
+            if claimed is None or claimed.claim(extract_format, title):
+                continue
+            for source, key, target_file in to_write.pop(title):
+                target_file = corpus.path if corpus is not None else target_file
+                manifest.record(source, title, infos[title].get('lastrevid'), wiki_obj.extract_format, target_file)
+                statuses.append('duplicate')
+
+        if not to_write:
+            continue
+        _, extracts = wiki_obj.query_pages(list(to_write), prop='extracts', **wiki_obj.extract_params())
+        for title, dumped in to_write.items():
+            wikipage = wiki_obj.build_page(infos[title], extracts.get(title, {}))
+            source, key, target_file = dumped[0]
+            if corpus is not None:
+                corpus.append(wikipage, extract_format, key=key)
+                target_file = corpus.path
+            else:
+                write_pickle(wikipage, target_file)
+            for source, _, _ in dumped:
+                manifest.record(source, wikipage.title, wikipage.lastrevid, wiki_obj.extract_format, target_file)
+                statuses.append('dumped')
+    return statuses
+
+
+def main(path_topN_pkl, workers=1, rate=None, max_retries=5, api_url=None, refresh=False,
+         batch_size=MAX_TITLES_PER_QUERY, corpus_path=None):
+    rate_limiter = RateLimiter(rate, burst=workers) if rate else None
+    wiki_html = ThrottledWikipedia('fr', extract_format=ExtractFormat.HTML, api_url=api_url,
+                                   rate_limiter=rate_limiter, max_retries=max_retries, pool_size=workers)
+    wiki_page = ThrottledWikipedia('fr', extract_format=ExtractFormat.WIKI, api_url=api_url,
+                                   rate_limiter=rate_limiter, max_retries=max_retries, pool_size=workers)
 
     sources = pkl.load(Path(path_topN_pkl).open('rb'))
 
-    sources = [s[1].strip() for s in sources]
+    # Each source is dumped once, and each page once even if several sources of different batches lead to it
+    sources = list(dict.fromkeys(s[1].strip() for s in sources))
+    claimed = ClaimedTitles()
+
+    corpus = CorpusWriter(corpus_path) if corpus_path is not None else None
+    targets = []
+    for folder, wiki_obj in [('data/10khtml', wiki_html), ('data/10kpages', wiki_page)]:
+        if corpus is not None:
+            manifest_path = f"{corpus_path}.{wiki_obj.extract_format.name.lower()}.manifest.jsonl"
+        else:
+            makedirs(folder, exist_ok=True)
+            remove_partial_files(folder)
+            manifest_path = Path(folder) / 'manifest.jsonl'
+        targets.append((folder, wiki_obj, Manifest(manifest_path)))
 
-    for s in sources:
-        dump_page(s, target_folder='data/10khtml', wiki_obj=wiki_html)
-        dump_page(s, target_folder='data/10kpages', wiki_obj=wiki_page)
+    batch_size = min(batch_size, MAX_TITLES_PER_QUERY)
+    batches = [sources[i:i + batch_size] for i in range(0, len(sources), batch_size)]
+
+    counts = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(dump_batch, batch, targets, refresh=refresh, corpus=corpus, claimed=claimed): batch
+                   for batch in batches}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                statuses = future.result()
+            except requests.RequestException as e:
+                statuses = ['failed'] * len(futures[future]) * len(targets)
+                print(f"batch starting with {futures[future][0]} failed: {e}")
+            for status in statuses:
+                counts[status] = counts.get(status, 0) + 1
+    print(', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+    folder, _, manifest = targets[1]
+    if corpus is not None:
+        corpus.close()
+        write_canonical_titles(manifest, f"{corpus_path}.{CANONICAL_TITLES_FILE}")
+    else:
+        write_canonical_titles(manifest, Path(folder) / CANONICAL_TITLES_FILE)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: \n python dump.py path_topN.pkl")
-        exit(1)
-    path_topN_pkl = sys.argv[1]
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("path_topN_pkl", type=str,
+                        help="Pkl file with the top N pages, as written by dump_topn.py")
+
+    parser.add_argument("--workers", default=1, type=int, required=False,
+                        help="Number of pages downloaded concurrently")
+
+    parser.add_argument("--rate", default=None, type=float, required=False,
+                        help="Maximum number of API requests per second, shared by all the workers")
+
+    parser.add_argument("--max_retries", default=5, type=int, required=False,
+                        help="Number of retries, with exponential backoff, of a failed API request")
+
+    parser.add_argument("--api_url", default=None, type=str, required=False,
+                        help="MediaWiki API to query instead of fr.wikipedia.org, e.g. fake_wiki_api.py")
+
+    parser.add_argument("--batch_size", default=MAX_TITLES_PER_QUERY, type=int, required=False,
+                        help="Number of titles resolved by a single API query (at most 50)")
+
+    parser.add_argument("--corpus_path", default=None, type=str, required=False,
+                        help="Corpus store to append the pages to, instead of one pickle per page and format")
+
+    parser.add_argument("--refresh", action='store_true',
+                        help="Check the revision of the pages already dumped and fetch the ones that changed")
+
+    args = parser.parse_args()
 
-    main(path_topN_pkl)
+    main(args.path_topN_pkl, workers=args.workers, rate=args.rate, max_retries=args.max_retries,
+         api_url=args.api_url, refresh=args.refresh, batch_size=args.batch_size,
+         corpus_path=args.corpus_path)
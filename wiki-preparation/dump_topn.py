@@ -1,6 +1,10 @@
 import struct
 import pickle
 import sys
+from array import array
+from os import path
+
+import numpy as np
 
 
 class DataInputStream:
@@ -46,53 +50,142 @@ class DataInputStream:
         return struct.unpack('>i', self.stream.read(4))[0]
 
 
-def main(top_n, path_wiki_pageranks_raw, path_wiki_pagerank_id_title_raw, path_wiki_pagerank_title):
-    pageranks = []
+def read_pageranks(path_wiki_pageranks_raw):
+    """
+    Memory-maps the PageRank vector written by WikipediaPagerank.java (big-endian doubles, indexed by page id).
+    """
+    return np.memmap(path_wiki_pageranks_raw, dtype='>f8', mode='r')
+
+
+class TitleIndex:
+    """
+    On-disk page id -> title index built from wikipedia-pagerank-page-id-title.raw.
+
+    It is made of a (id_limit, 2) array of (start, end) byte offsets, indexed by page id,
+    and of the concatenated UTF-8 titles. Both are memory-mapped, a missing page id has an empty span.
+    """
+
+    def __init__(self, index_prefix):
+        self.spans = np.load(index_prefix + '.offsets.npy', mmap_mode='r')
+        self.titles = np.memmap(index_prefix + '.titles.bin', dtype=np.uint8, mode='r')
+
+    @staticmethod
+    def build(path_wiki_pagerank_id_title_raw, index_prefix):
+        page_ids = array('q')
+        starts = array('q')
+        ends = array('q')
+        offset = 0
+        with open(path_wiki_pagerank_id_title_raw, 'rb') as f, open(index_prefix + '.titles.bin', 'wb') as out:
+            for title in f:
+                title = title.rstrip()
+                page_ids.append(int(f.readline()))
+                starts.append(offset)
+                offset += out.write(title)
+                ends.append(offset)
+
+        page_ids = np.frombuffer(page_ids, dtype=np.int64)
+        spans = np.zeros((page_ids.max() + 1 if len(page_ids) else 0, 2), dtype=np.int64)
+        spans[page_ids, 0] = np.frombuffer(starts, dtype=np.int64)
+        spans[page_ids, 1] = np.frombuffer(ends, dtype=np.int64)
+        np.save(index_prefix + '.offsets.npy', spans)
+
+    @classmethod
+    def open(cls, path_wiki_pagerank_id_title_raw):
+        """
+        Opens the index stored next to the raw file, building it first if it is missing or outdated.
+        """
+        index_prefix = path_wiki_pagerank_id_title_raw
+        offsets_fn = index_prefix + '.offsets.npy'
+        if not path.exists(offsets_fn) or path.getmtime(offsets_fn) < path.getmtime(path_wiki_pagerank_id_title_raw):
+            cls.build(path_wiki_pagerank_id_title_raw, index_prefix)
+        return cls(index_prefix)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def has_title(self, id_limit):
+        """
+        Boolean mask of length id_limit telling which page ids have a title.
+        """
+        mask = np.zeros(id_limit, dtype=bool)
+        n = min(id_limit, len(self.spans))
+        mask[:n] = self.spans[:n, 1] > self.spans[:n, 0]
+        return mask
+
+    def get(self, page_id, default=None):
+        if page_id < 0 or page_id >= len(self.spans):
+            return default
+        start, end = self.spans[page_id]
+        if start == end:
+            return default
+        return self.titles[start:end].tobytes().decode('utf-8')
+
+    def __getitem__(self, page_id):
+        title = self.get(page_id)
+        if title is None:
+            raise KeyError(page_id)
+        return title
+
+
+def select_top_n(scores, top_n, candidates=None):
+    """
+    Returns the ids of the top_n highest scores, in descending order of score.
+    If given, candidates restricts the selection to a boolean mask over the ids.
+    """
+    if candidates is None:
+        candidate_ids = np.arange(len(scores))
+    else:
+        candidate_ids = np.flatnonzero(candidates)
+    candidate_scores = np.asarray(scores[candidate_ids], dtype=np.float64)
+
+    top_n = min(top_n, len(candidate_ids))
+    if top_n <= 0:
+        return candidate_ids[:0]
+    if top_n < len(candidate_ids):
+        # Linear-time partial selection, only the selected scores are then sorted
+        selected = np.argpartition(-candidate_scores, top_n - 1)[:top_n]
+    else:
+        selected = np.arange(len(candidate_ids))
+    order = np.argsort(-candidate_scores[selected], kind='stable')
+    return candidate_ids[selected[order]]
 
-    with open(path_wiki_pageranks_raw, 'rb') as f:
-        stream = DataInputStream(f)
-        while True:
-            try:
-                val = stream.read_double()
-                pageranks.append(val)
-            except struct.error:
-                print("I am dead")
-                break
 
-    id_title = {}
+def main(top_n, path_wiki_pageranks_raw, path_wiki_pagerank_id_title_raw, path_wiki_pagerank_title=None):
+    top_n_list = [top_n] if isinstance(top_n, int) else list(top_n)
+    pageranks = read_pageranks(path_wiki_pageranks_raw)
 
-    with open(path_wiki_pagerank_id_title_raw) as f:
-        for title in f:
-            page_id = int(f.readline())
-            id_title[page_id] = title.rstrip()
+    id_title = TitleIndex.open(path_wiki_pagerank_id_title_raw)
 
-    with open(path_wiki_pagerank_title, 'w') as f:
-        for page_id, pagerank in enumerate(pageranks):
-            if pagerank > 0.0 and page_id in id_title:
-                title = id_title.get(page_id)
-                f.write('{} \t {} \n '.format(pagerank, title))
+    # Only the pages with a positive score and a known title can be selected
+    candidates = (pageranks > 0.0) & id_title.has_title(len(pageranks))
 
-    with open(path_wiki_pagerank_title) as f:
-        tuples = [(i.split('\t')[0], i.split('\t')[1])
-                  for i in f.readlines() if i.strip()]
+    # The selection is done once for the largest N, smaller N are prefixes of it
+    top_ids = select_top_n(pageranks, max(top_n_list), candidates)
+    top_pages = [(pagerank, id_title[page_id])
+                 for page_id, pagerank in zip(top_ids.tolist(), pageranks[top_ids].tolist())]
 
-    sorted_ = sorted(tuples, key=lambda tup: tup[0])
+    if path_wiki_pagerank_title is not None:
+        with open(path_wiki_pagerank_title, 'w') as f:
+            for pagerank, title in top_pages:
+                f.write('{}\t{}\n'.format(pagerank, title))
 
-    pickle.dump(sorted_[:top_n], open(f"top_{top_n}.pkl", 'wb'))
+    for n in top_n_list:
+        with open(f"top_{n}.pkl", 'wb') as f:
+            pickle.dump(top_pages[:n], f)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
+    if len(sys.argv) < 4:
         print(
-            "Usage: \n dump_topn.py top_N input_path_wikipedia-pageranks.raw"
+            "Usage: \n dump_topn.py top_N[,top_N...] input_path_wikipedia-pageranks.raw"
             " input_path_wikipedia-pagerank-id-title.raw"
-            " output_path_wikipedia-pagerank-title.txt")
+            " [output_path_wikipedia-pagerank-title.txt]")
         exit(1)
 
-    top_n = int(sys.argv[1])
+    top_n = [int(n) for n in sys.argv[1].split(',')]
     path_wiki_pageranks_raw = sys.argv[2]
     path_wiki_pagerank_id_title_raw = sys.argv[3]
-    path_wiki_pagerank_title = sys.argv[4]
+    path_wiki_pagerank_title = sys.argv[4] if len(sys.argv) > 4 else None
 
     main(top_n, path_wiki_pageranks_raw,
          path_wiki_pagerank_id_title_raw,
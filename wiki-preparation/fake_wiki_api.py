@@ -0,0 +1,161 @@
+"""
+Local stand-in for the MediaWiki API (action=query with prop=info|extracts|categories), serving generated
+articles so that dump.py can be run and benchmarked offline:
+
+    python fake_wiki_api.py --port 8765 --latency 0.05
+    python dump.py top_1000.pkl --api_url http://localhost:8765/w/api.php --workers 16
+
+Titles are normalized as MediaWiki does (underscores, first letter), a title ending with " (redirection)"
+redirects to the same title without it, and a title containing "Inexistant" is a missing page.
+"""
+
+import argparse
+import json
+import random
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REDIRECT_SUFFIX = " (redirection)"
+MISSING_MARKER = "Inexistant"
+
+
+def normalize_title(title):
+    title = title.replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+def page_id(title):
+    return zlib.crc32(title.encode('utf-8')) % 10000000 + 1
+
+
+def wiki_extract(title):
+    summary = f"{title} est un article de test.\nIl sert à simuler l'API de Wikipédia."
+    sections = [
+        (2, "Histoire", f"L'histoire de {title} " + "est longue. " * 60),
+        (3, "Origines", "Les origines sont anciennes. " * 30),
+        (2, "Description", f"{title} se décrit ainsi. " * 40 + "\nUne deuxième ligne."),
+        (2, "Voir aussi", "Articles connexes"),
+    ]
+    text = summary
+    for level, section_title, section_text in sections:
+        text += "\n\n{0} {1} {0}\n{2}".format('=' * level, section_title, section_text)
+    return text
+
+
+def html_extract(title):
+    summary = f"<p>{title} est un article de test.</p>\n<p>Il sert à simuler l'API de Wikipédia.</p>"
+    sections = [
+        (2, "Histoire", f"<p>L'histoire de {title} " + "est longue. " * 60 + "</p>"),
+        (3, "Origines", "<ul><li>Les origines sont anciennes.</li></ul>"),
+        (2, "Description", f"<p>{title} se décrit ainsi. " * 40 + "</p>\n<p>Une deuxième ligne.</p>"),
+        (2, "Voir aussi", "<ul><li>Articles connexes</li></ul>"),
+    ]
+    text = summary
+    for level, section_title, section_text in sections:
+        text += '\n<h{0}><span id="{1}">{1}</span></h{0}>\n{2}'.format(level, section_title, section_text)
+    return text
+
+
+class FakeWikiHandler(BaseHTTPRequestHandler):
+    # Set on the class by main()
+    latency = 0.0
+    error_rate = 0.0
+    revision = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.send_response(503)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        body = json.dumps(self.query(params)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def query(self, params):
+        titles = params.get('titles', '').split('|')
+        props = params.get('prop', '').split('|')
+        result = {'query': {}}
+
+        normalized, redirects, resolved = [], [], []
+        for title in titles:
+            target = normalize_title(title)
+            if target != title:
+                normalized.append({'from': title, 'to': target})
+            if target.endswith(REDIRECT_SUFFIX):
+                redirects.append({'from': target, 'to': target[:-len(REDIRECT_SUFFIX)]})
+                target = target[:-len(REDIRECT_SUFFIX)]
+            if target not in resolved:
+                resolved.append(target)
+        if normalized:
+            result['query']['normalized'] = normalized
+        if redirects and params.get('redirects'):
+            result['query']['redirects'] = redirects
+
+        # Whole article extracts are returned one page per request, as on the real API
+        extract_from = int(params.get('excontinue', 0))
+        pages = {}
+        missing = 0
+        for i, title in enumerate(resolved):
+            if MISSING_MARKER in title:
+                missing += 1
+                pages[str(-missing)] = {'ns': 0, 'title': title, 'missing': ''}
+                continue
+            page = {'pageid': page_id(title), 'ns': 0, 'title': title}
+            if 'info' in props:
+                page.update({'contentmodel': 'wikitext', 'pagelanguage': 'fr', 'touched': '2020-01-20T00:00:00Z',
+                             'lastrevid': page_id(title) * 10 + self.revision, 'length': 4000,
+                             'displaytitle': title})
+            if 'extracts' in props and i == extract_from:
+                if params.get('explaintext'):
+                    page['extract'] = wiki_extract(title)
+                else:
+                    page['extract'] = html_extract(title)
+            if 'categories' in props:
+                page['categories'] = [{'ns': 14, 'title': 'Catégorie:Article de test'}]
+                if len(title) % 5 == 0:
+                    page['categories'].append({'ns': 14, 'title': 'Catégorie:Wikipédia:ébauche test'})
+            pages[str(page['pageid'])] = page
+        result['query']['pages'] = pages
+
+        if 'extracts' in props and extract_from + 1 < len(resolved):
+            result['continue'] = {'excontinue': extract_from + 1, 'continue': '||'}
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", default=8765, type=int, required=False,
+                        help="Port to listen on")
+
+    parser.add_argument("--latency", default=0.0, type=float, required=False,
+                        help="Delay in seconds added to each response")
+
+    parser.add_argument("--error_rate", default=0.0, type=float, required=False,
+                        help="Fraction of requests answered with a 503 error")
+
+    parser.add_argument("--revision", default=0, type=int, required=False,
+                        help="Offset added to every lastrevid, to simulate edited articles")
+
+    args = parser.parse_args()
+
+    FakeWikiHandler.latency = args.latency
+    FakeWikiHandler.error_rate = args.error_rate
+    FakeWikiHandler.revision = args.revision
+    server = ThreadingHTTPServer(('localhost', args.port), FakeWikiHandler)
+    print(f"Serving a fake MediaWiki API on http://localhost:{args.port}/w/api.php")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
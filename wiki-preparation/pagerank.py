@@ -0,0 +1,221 @@
+import argparse
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy import sparse
+
+from dump_topn import TitleIndex, read_pageranks
+
+# Between 0.0 and 1.0; standard value is 0.85
+DAMPING = 0.85
+
+
+def read_links_raw(path_wiki_pagerank_page_links_raw):
+    """
+    Reads wikipedia-pagerank-page-links.raw as written by PageLinksList.writeRawFile:
+    a big-endian int count followed by the packed run-length links
+    (target page ID, number of incoming links, source page IDs...), ... .
+    """
+    with open(path_wiki_pagerank_page_links_raw, 'rb') as f:
+        count = struct.unpack('>i', f.read(4))[0]
+        links = np.fromfile(f, dtype='>i4', count=count)
+    if len(links) != count:
+        raise ValueError(f"Truncated links file: {len(links)} of {count} items")
+    return links.astype(np.int32)
+
+
+def links_to_csr(links):
+    """
+    Converts the packed run-length links into a CSR matrix where row = target page and column = source page.
+    The sources keep their file order inside each row, so the sums are done in the same order as Pagerank.java.
+    """
+    # Only the run headers have to be walked in Python, the rest is done on whole arrays
+    headers = []
+    raw = memoryview(links)
+    i = 0
+    while i < len(raw):
+        headers.append(i)
+        i += raw[i + 1] + 2
+    headers = np.array(headers, dtype=np.int64)
+
+    dests = links[headers]
+    counts = links[headers + 1]
+    if np.any(np.diff(dests) <= 0):
+        raise ValueError("Links must be grouped by increasing target page ID")
+
+    is_source = np.ones(len(links), dtype=bool)
+    is_source[headers] = False
+    is_source[headers + 1] = False
+    sources = links[is_source]
+
+    id_limit = int(max(dests.max(initial=-1), sources.max(initial=-1))) + 1
+    row_counts = np.zeros(id_limit, dtype=np.int64)
+    row_counts[dests] = counts
+    indptr = np.concatenate(([0], np.cumsum(row_counts)))
+    data = np.ones(len(sources), dtype=np.float64)
+    return sparse.csr_matrix((data, sources, indptr), shape=(id_limit, id_limit))
+
+
+class SparsePagerank:
+    """
+    Same PageRank computation as Pagerank.java, on a CSR link matrix.
+    """
+
+    def __init__(self, link_matrix, threads=1):
+        self.link_matrix = link_matrix
+        id_limit = link_matrix.shape[0]
+
+        self.num_outgoing_links = np.bincount(link_matrix.indices, minlength=id_limit).astype(np.float64)
+        has_incoming_links = np.diff(link_matrix.indptr) > 0
+        self.has_outgoing_links = self.num_outgoing_links > 0
+        self.is_active = self.has_outgoing_links | has_incoming_links
+        self.num_active = int(self.is_active.sum())
+        self.dangling_ids = np.flatnonzero(self.is_active & ~self.has_outgoing_links)
+
+        # Initialize PageRanks uniformly for active pages
+        self.pageranks = np.zeros(id_limit, dtype=np.float64)
+        self.pageranks[self.is_active] = 1.0 / self.num_active
+
+        self.blocks = self._split_rows(threads)
+        self.executor = ThreadPoolExecutor(threads) if len(self.blocks) > 1 else None
+
+    def warm_start(self, previous_pageranks):
+        """
+        Starts from a previous PageRank vector (e.g. computed on an older dump) instead of the uniform one.
+        Pages that became active since then get the uniform weight, and the vector is normalized again.
+        """
+        pageranks = np.zeros_like(self.pageranks)
+        n = min(len(previous_pageranks), len(pageranks))
+        pageranks[:n] = previous_pageranks[:n]
+        pageranks[~self.is_active] = 0.0
+        pageranks[self.is_active & (pageranks <= 0.0)] = 1.0 / self.num_active
+        self.pageranks = pageranks / pageranks.sum()
+
+    def _split_rows(self, threads):
+        # Row blocks with about the same number of links, sharing the arrays of the full matrix
+        indptr = self.link_matrix.indptr
+        id_limit = self.link_matrix.shape[0]
+        bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], threads + 1)[1:-1])
+        bounds = np.unique(np.concatenate(([0], bounds, [id_limit])))
+        blocks = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            first, last = indptr[start], indptr[end]
+            block = sparse.csr_matrix((self.link_matrix.data[first:last], self.link_matrix.indices[first:last],
+                                       indptr[start:end + 1] - first), shape=(end - start, id_limit), copy=False)
+            blocks.append((start, end, block))
+        return blocks
+
+    def _distribute(self, pageranks):
+        new_pageranks = np.empty_like(pageranks)
+
+        def product(block):
+            start, end, matrix = block
+            new_pageranks[start:end] = matrix @ pageranks
+
+        if self.executor is None:
+            for block in self.blocks:
+                product(block)
+        else:
+            list(self.executor.map(product, self.blocks))
+        return new_pageranks
+
+    def iterate_once(self, damping=DAMPING):
+        pageranks = self.pageranks
+
+        # Pre-divide by number of outgoing links
+        pageranks[self.has_outgoing_links] /= self.num_outgoing_links[self.has_outgoing_links]
+
+        # Distribute PageRanks over links (main calculation)
+        new_pageranks = self._distribute(pageranks)
+
+        # Global bias due to pages without outgoing links, summed left to right like the Java loop
+        bias = np.cumsum(pageranks[self.dangling_ids])[-1] if len(self.dangling_ids) else 0.0
+        bias /= self.num_active
+
+        # Apply bias and damping to all active pages
+        temp = bias * damping + (1 - damping) / self.num_active
+        pageranks[self.is_active] = new_pageranks[self.is_active] * damping + temp
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def write_pageranks(pageranks, path_wiki_pageranks_raw):
+    # Same layout as the DataOutputStream.writeDouble loop of WikipediaPagerank.java
+    pageranks.astype('>f8').tofile(path_wiki_pageranks_raw)
+
+
+def print_pagerank_change_ratios(prev_pageranks, pageranks):
+    changed = (pageranks != 0) & (prev_pageranks != 0)
+    if not changed.any():
+        return
+    ratios = pageranks[changed] / prev_pageranks[changed]
+    print(f"Range of ratio of changes: {ratios.min()} to {ratios.max()}")
+
+
+def print_top_pages(pageranks, id_title, num_pages=30):
+    for page_id in np.argsort(-pageranks, kind='stable')[:num_pages]:
+        print("  {:.3f}  {}".format(np.log10(pageranks[page_id]), id_title.get(int(page_id))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("path_page_links_raw", type=str,
+                        help="Path to wikipedia-pagerank-page-links.raw")
+
+    parser.add_argument("nb_iterations", type=int,
+                        help="Number of PageRank iterations (maximum number if --tolerance is given)")
+
+    parser.add_argument("--tolerance", default=None, type=float, required=False,
+                        help="Stop as soon as the L1 change of the PageRank vector is below this value")
+
+    parser.add_argument("--warm_start", default=None, type=str, required=False,
+                        help="Previous wikipedia-pageranks.raw to start the iterations from")
+
+    parser.add_argument("--output_pageranks_raw", default="wikipedia-pageranks.raw", type=str, required=False,
+                        help="Path where the PageRank vector is written")
+
+    parser.add_argument("--id_title_raw", default=None, type=str, required=False,
+                        help="Path to wikipedia-pagerank-page-id-title.raw, to print the top pages at each iteration")
+
+    parser.add_argument("--threads", default=1, type=int, required=False,
+                        help="Number of threads used for the sparse matrix-vector products")
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    link_matrix = links_to_csr(read_links_raw(args.path_page_links_raw))
+    print(f"Reading {args.path_page_links_raw}: {link_matrix.nnz / 1000000.0:.3f} million links."
+          f" Done ({time.time() - start_time:.3f} s)")
+
+    id_title = TitleIndex.open(args.id_title_raw) if args.id_title_raw is not None else None
+
+    print("Computing PageRank...")
+    pr = SparsePagerank(link_matrix, threads=args.threads)
+    if args.warm_start is not None:
+        pr.warm_start(read_pageranks(args.warm_start))
+    prev_pageranks = pr.pageranks.copy()
+    for i in range(args.nb_iterations):
+        start_time = time.time()
+        pr.iterate_once(DAMPING)
+        delta = np.abs(pr.pageranks - prev_pageranks).sum()
+        print(f"Iteration {i} ({time.time() - start_time:.3f} s), L1 change: {delta}")
+
+        print_pagerank_change_ratios(prev_pageranks, pr.pageranks)
+        if id_title is not None:
+            print_top_pages(pr.pageranks, id_title)
+        if args.tolerance is not None and delta < args.tolerance:
+            print(f"Converged after {i + 1} iterations")
+            break
+        prev_pageranks = pr.pageranks.copy()
+    pr.close()
+
+    write_pageranks(pr.pageranks, args.output_pageranks_raw)
+
+
+if __name__ == "__main__":
+    main()
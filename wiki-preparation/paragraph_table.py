@@ -0,0 +1,110 @@
+"""
+Columnar view of the paragraph lengths of the article stats computed by compute_wiki_stats.py.
+
+The paragraphs of all the articles are stored in flat arrays, the paragraphs of an article being contiguous
+(summary first, then the sections in order) and delimited by CSR-like offsets. A filter on the paragraph lengths
+is then a mask over all the paragraphs, counted by article with np.add.reduceat.
+"""
+
+import numpy as np
+
+# Section id of the paragraphs of the summary
+SUMMARY_SECTION = -1
+
+
+class ParagraphTable:
+    def __init__(self, keys, lengths, article_ids, section_ids, offsets, total_text_length, draft, homonym,
+                 is_year):
+        self.keys = keys
+        self.lengths = lengths
+        self.article_ids = article_ids
+        self.section_ids = section_ids
+        self.offsets = offsets
+        self.total_text_length = total_text_length
+        self.draft = draft
+        self.homonym = homonym
+        self.is_year = is_year
+
+    @classmethod
+    def from_stats(cls, stats):
+        """
+        Builds the table from the {filename: article stats} dict. The articles whose stats are an error
+        ('TextError', 'SectionError', ...) are left out.
+        """
+        keys, lengths, section_ids, counts = [], [], [], []
+        total_text_length, draft, homonym, is_year = [], [], [], []
+        for key, article_stats in stats.items():
+            if not isinstance(article_stats, dict):
+                continue
+            keys.append(key)
+            article_lengths = list(article_stats['paragraph_length_by_summary'])
+            article_sections = [SUMMARY_SECTION] * len(article_lengths)
+            for section_id, section in enumerate(article_stats['paragraph_length_by_sections']):
+                article_lengths.extend(section)
+                article_sections.extend([section_id] * len(section))
+            lengths.extend(article_lengths)
+            section_ids.extend(article_sections)
+            counts.append(len(article_lengths))
+            total_text_length.append(article_stats['total_text_length'])
+            draft.append(article_stats['draft_in_category'])
+            homonym.append(article_stats['homonym_in_category'])
+            is_year.append(article_stats.get('is_a_year_article', False))
+
+        counts = np.array(counts, dtype=np.int64)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(keys,
+                   np.array(lengths, dtype=np.int64),
+                   np.repeat(np.arange(len(keys), dtype=np.int32), counts),
+                   np.array(section_ids, dtype=np.int32),
+                   offsets,
+                   np.array(total_text_length, dtype=np.int64),
+                   np.array(draft, dtype=bool),
+                   np.array(homonym, dtype=bool),
+                   np.array(is_year, dtype=bool))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def paragraph_mask(self, min_len_paragraphs=500, max_len_paragraphs=1000):
+        """
+        Paragraphs kept by check_number_paragraphs: articles shorter than min_len_paragraphs keep none.
+        """
+        mask = (self.lengths >= min_len_paragraphs) & (self.lengths < max_len_paragraphs)
+        mask &= self.total_text_length[self.article_ids] >= min_len_paragraphs
+        return mask
+
+    def count_by_article(self, paragraph_mask):
+        # reduceat gives the first item instead of 0 for empty articles, which are also the only ones that can
+        # start at the end of the array
+        padded = np.append(paragraph_mask.astype(np.int64), 0)
+        counts = np.add.reduceat(padded, self.offsets[:-1])
+        counts[self.offsets[:-1] == self.offsets[1:]] = 0
+        return counts
+
+    def article_mask(self, min_paragraphs=5, min_len_paragraphs=500, max_len_paragraphs=1000, draft=False,
+                     homonym=False, years=True, paragraph_mask=None):
+        """
+        Articles kept by filter_dic and filter_min_paras, and by the year filter when years is False.
+        """
+        if paragraph_mask is None:
+            paragraph_mask = self.paragraph_mask(min_len_paragraphs, max_len_paragraphs)
+        mask = (self.draft == draft) & (self.homonym == homonym)
+        mask &= self.count_by_article(paragraph_mask) >= min_paragraphs
+        if not years:
+            mask &= ~self.is_year
+        return mask
+
+    def filter(self, min_paragraphs=5, min_len_paragraphs=500, max_len_paragraphs=1000, draft=False,
+               homonym=False, years=True):
+        """
+        Returns the {filename: lengths of the kept paragraphs} dict of the articles kept by the filters.
+        """
+        paragraph_mask = self.paragraph_mask(min_len_paragraphs, max_len_paragraphs)
+        article_mask = self.article_mask(min_paragraphs, draft=draft, homonym=homonym, years=years,
+                                         paragraph_mask=paragraph_mask)
+        filtered = {}
+        for article_id in np.flatnonzero(article_mask):
+            start, end = self.offsets[article_id], self.offsets[article_id + 1]
+            filtered[self.keys[article_id]] = self.lengths[start:end][paragraph_mask[start:end]].tolist()
+        return filtered
@@ -0,0 +1,57 @@
+"""
+Section walking shared by compute_wiki_stats.py and stats_analysis_results.py.
+
+The text of the subsections of a section is the concatenation, in pre-order, of the text of each subsection
+followed by a new line. It is built with a single walk over the wiki section tree and, when it is given, the html
+section tree, which tells at the same time whether the html subsections contain a list.
+"""
+
+from itertools import zip_longest
+
+# Sections after which the text of an article is not kept
+END_SECTION_TITLES = ['Voir aussi', 'Articles connexes', 'Liens externes', 'Notes et références']
+
+LIST_TAG = '<li>'
+
+
+def _subsections(section):
+    return section.sections if section is not None else []
+
+
+def iter_subsection_texts(section, section_html=None):
+    """
+    Yields the (text, has_list) pieces of the subsections of a section, in pre-order. The wiki and html subsections
+    are paired by position; text is empty for an html subsection without a wiki one, and has_list tells whether the
+    html subsection contains a list.
+    """
+    stack = list(reversed(list(zip_longest(_subsections(section), _subsections(section_html)))))
+    while stack:
+        subsection, subsection_html = stack.pop()
+        text = subsection.text + '\n' if subsection is not None else ''
+        yield text, subsection_html is not None and LIST_TAG in subsection_html.text
+        stack.extend(reversed(list(zip_longest(_subsections(subsection), _subsections(subsection_html)))))
+
+
+def get_subsections_text(section, section_html=None):
+    """
+    Returns the text of the subsections of a section, or an empty text if the html version of the section is given
+    and its subsections contain a list.
+    """
+    pieces = []
+    for text, has_list in iter_subsection_texts(section, section_html):
+        if has_list:
+            return ''
+        pieces.append(text)
+    return ''.join(pieces)
+
+
+def get_section_text(section, section_html=None):
+    """
+    Returns the text of a section followed by the text of its subsections. When the html version of the section
+    is given, the text of the section and the text of the subsections are each left out if they contain a list.
+    """
+    if section_html is not None and LIST_TAG in section_html.text:
+        current_section_text = ''
+    else:
+        current_section_text = section.text + '\n'
+    return current_section_text + get_subsections_text(section, section_html)
@@ -0,0 +1,279 @@
+import argparse
+import gzip
+import queue
+import re
+import struct
+import threading
+import time
+from collections import deque
+from multiprocessing import Pool
+from os import path
+
+import numpy as np
+
+# Same cache files as WikipediaPagerank.java
+PAGE_ID_TITLE_RAW_FILE = "wikipedia-pagerank-page-id-title.raw"
+PAGE_LINKS_RAW_FILE = "wikipedia-pagerank-page-links.raw"
+
+# One token of an "INSERT INTO ... VALUES (...),(...);" statement: punctuation, whitespace, quoted string,
+# NULL or number
+_TOKEN = re.compile(r"[(),]|\s+|'((?:[^'\\]|\\.)*)'|(NULL)|([0-9.eE+\-]+)")
+_ESCAPED = re.compile(r"\\(.)")
+
+# Tokens allowed after each parsing state of parse_tuples, and the state they lead to
+_TRANSITIONS = {
+    'start': {'(': 'first value'},  # before a tuple
+    'first value': {'value': 'separator', ')': 'tuple separator'},  # after '('
+    'value': {'value': 'separator'},  # after a ',' inside a tuple
+    'separator': {',': 'value', ')': 'tuple separator'},  # after a value
+    'tuple separator': {',': 'tuple'},  # after ')'
+    'tuple': {'(': 'first value'},  # after a ',' between tuples
+}
+_END_STATES = {'start', 'tuple separator'}
+
+# Worker-side lookups for the pagelinks dump, set once per process by _init_links_worker
+_title_to_id = None
+_page_ids = None
+
+
+def parse_tuples(values_text):
+    """
+    Parses the "(...),(...),...,(...)" part of an INSERT statement into a list of tuples,
+    with the same typing as SqlReader.java: int, float, str or None.
+    Raises ValueError on malformed input, as SqlReader.java does, instead of skipping what cannot be read.
+    """
+    result = []
+    current = None
+    state = 'start'
+    pos = 0
+    while pos < len(values_text):
+        match = _TOKEN.match(values_text, pos)
+        if match is None:
+            raise ValueError(f"Unexpected text at offset {pos}: {values_text[pos:pos + 32]!r}")
+        pos = match.end()
+        token = match.group(0)
+        if token.isspace():
+            continue
+        text, null, number = match.groups()
+        kind = token if token in '(),' else 'value'
+        if kind not in _TRANSITIONS[state]:
+            raise ValueError(f"Unexpected {token[:32]!r} at offset {match.start()}, expected {state}")
+        state = _TRANSITIONS[state][kind]
+        if token == '(':
+            current = []
+        elif token == ')':
+            result.append(current)
+        elif token == ',':
+            continue
+        elif text is not None:
+            current.append(_ESCAPED.sub(r"\1", text) if '\\' in text else text)
+        elif null is not None:
+            current.append(None)
+        elif '.' in number or 'e' in number or 'E' in number:
+            current.append(float(number))
+        else:
+            current.append(int(number))
+    if state not in _END_STATES:
+        raise ValueError(f"Unexpected end of the statement, expected {state}")
+    return result
+
+
+def _parse_page_chunk(statements):
+    rows = []
+    for statement in statements:
+        for row in parse_tuples(statement):
+            if len(row) != 13:
+                raise ValueError(f"Incorrect number of columns: {len(row)}")
+            page_id, namespace, title = row[0], row[1], row[2]
+            if not isinstance(namespace, int) or not isinstance(page_id, int) or not isinstance(title, str):
+                raise ValueError(f"Malformed page row: {row[:3]}")
+            if namespace != 0:  # Filter out pages not in the main namespace
+                continue
+            rows.append((title, page_id))
+    return rows
+
+
+def _init_links_worker(title_to_id):
+    global _title_to_id, _page_ids
+    _title_to_id = title_to_id
+    _page_ids = set(title_to_id.values())
+
+
+def _parse_links_chunk(statements):
+    rawlinks = []
+    for statement in statements:
+        for row in parse_tuples(statement):
+            if len(row) != 4:
+                raise ValueError(f"Incorrect number of columns: {len(row)}")
+            src_id, namespace, dest_title = row[0], row[1], row[2]
+            if not isinstance(src_id, int) or not isinstance(namespace, int) or not isinstance(dest_title, str):
+                raise ValueError(f"Malformed pagelinks row: {row[:3]}")
+            # Skip if not in main namespace or either page entry not found
+            if namespace != 0 or src_id not in _page_ids:
+                continue
+            dest_id = _title_to_id.get(dest_title)
+            if dest_id is not None:
+                rawlinks.append(dest_id << 32 | src_id)
+    return np.array(rawlinks, dtype=np.int64)
+
+
+def _read_statements(sql_gz_path, table_name, chunks, chunk_size):
+    prefix = "INSERT INTO `" + table_name + "` VALUES "
+    try:
+        with gzip.open(sql_gz_path, 'rt', encoding='utf-8', errors='replace') as f:
+            chunk = []
+            for line in f:
+                line = line.rstrip('\r\n')
+                if not line.startswith(prefix) or not line.endswith(';'):
+                    continue
+                chunk.append(line[len(prefix):-1])
+                if len(chunk) == chunk_size:
+                    chunks.put(chunk)
+                    chunk = []
+            if chunk:
+                chunks.put(chunk)
+        chunks.put(None)
+    except BaseException as e:
+        chunks.put(e)
+
+
+def parse_sql_dump(sql_gz_path, table_name, parse_chunk, workers=1, chunk_size=4, initializer=None, initargs=()):
+    """
+    Streams the INSERT statements of a gzipped SQL dump and yields parse_chunk(statements) for each chunk
+    of chunk_size statements, in file order. Decompression runs in its own thread while the chunks are
+    parsed by a pool of worker processes, with a bounded number of chunks in flight.
+    """
+    chunks = queue.Queue(maxsize=2 * workers)
+    reader = threading.Thread(target=_read_statements, args=(sql_gz_path, table_name, chunks, chunk_size),
+                              daemon=True)
+    reader.start()
+
+    def next_chunk():
+        chunk = chunks.get()
+        if isinstance(chunk, BaseException):
+            raise chunk
+        return chunk
+
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        chunk = next_chunk()
+        while chunk is not None:
+            yield parse_chunk(chunk)
+            chunk = next_chunk()
+        return
+
+    with Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        chunk = next_chunk()
+        while chunk is not None:
+            pending.append(pool.apply_async(parse_chunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+            chunk = next_chunk()
+        while pending:
+            yield pending.popleft().get()
+
+
+def read_page_sql(page_sql_gz_path, workers=1):
+    """
+    Returns the mapping of page title to page ID of the main namespace, as PageIdTitleMap.readSqlFile.
+    """
+    start_time = time.time()
+    title_to_id = {}
+    for rows in parse_sql_dump(page_sql_gz_path, 'page', _parse_page_chunk, workers):
+        for title, page_id in rows:
+            if title in title_to_id:
+                raise ValueError(f"Duplicate page title: {title}")
+            title_to_id[title] = page_id
+        print(f"\rParsing {page_sql_gz_path}: {len(title_to_id) / 1000000.0:.3f} million entries stored...", end='')
+    print(f"\rParsing {page_sql_gz_path}: {len(title_to_id) / 1000000.0:.3f} million entries stored..."
+          f" Done ({time.time() - start_time:.3f} s)")
+    return title_to_id
+
+
+def postprocess_links(rawlinks):
+    """
+    Sorts the (target << 32 | source) links and packs them in the run-length format of PageLinksList.java:
+    (target page ID, number of incoming links, source page IDs...), ... .
+    """
+    rawlinks = np.sort(rawlinks)
+    dests = (rawlinks >> 32).astype(np.int32)
+    sources = (rawlinks & 0xFFFFFFFF).astype(np.int32)
+
+    unique_dests, starts, counts = np.unique(dests, return_index=True, return_counts=True)
+    links = np.empty(len(rawlinks) + 2 * len(unique_dests), dtype=np.int32)
+    headers = starts + 2 * np.arange(len(unique_dests))
+    links[headers] = unique_dests
+    links[headers + 1] = counts
+    # Each source is shifted by the two header items of its own run and of all the previous ones
+    links[np.arange(len(rawlinks)) + 2 * np.repeat(np.arange(1, len(unique_dests) + 1), counts)] = sources
+    return links
+
+
+def read_pagelinks_sql(pagelinks_sql_gz_path, title_to_id, workers=1):
+    """
+    Returns the packed list of page links between pages of the main namespace, as PageLinksList.readSqlFile.
+    """
+    start_time = time.time()
+    parts = []
+    nb_links = 0
+    for rawlinks in parse_sql_dump(pagelinks_sql_gz_path, 'pagelinks', _parse_links_chunk, workers,
+                                   initializer=_init_links_worker, initargs=(title_to_id,)):
+        parts.append(rawlinks)
+        nb_links += len(rawlinks)
+        print(f"\rParsing {pagelinks_sql_gz_path}: {nb_links / 1000000.0:.3f} million entries stored", end='')
+    print(f"\rParsing {pagelinks_sql_gz_path}: {nb_links / 1000000.0:.3f} million entries stored."
+          f" Done ({time.time() - start_time:.3f} s)")
+    return postprocess_links(np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64))
+
+
+def write_page_id_title_raw(title_to_id, path_raw):
+    with open(path_raw, 'w', encoding='utf-8', newline='\n') as f:
+        for title, page_id in title_to_id.items():
+            f.write(f"{title}\n{page_id}\n")
+
+
+def read_page_id_title_raw(path_raw):
+    title_to_id = {}
+    with open(path_raw, encoding='utf-8') as f:
+        for title in f:
+            title_to_id[title.rstrip('\n')] = int(f.readline())
+    return title_to_id
+
+
+def write_page_links_raw(links, path_raw):
+    with open(path_raw, 'wb') as f:
+        f.write(struct.pack('>i', len(links)))
+        links.astype('>i4').tofile(f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("path_page_sql_gz", type=str,
+                        help="Path to the frwiki-XXXXXXXX-page.sql.gz dump")
+
+    parser.add_argument("path_pagelinks_sql_gz", type=str,
+                        help="Path to the frwiki-XXXXXXXX-pagelinks.sql.gz dump")
+
+    parser.add_argument("--workers", default=1, type=int, required=False,
+                        help="Number of processes parsing the SQL statements")
+
+    args = parser.parse_args()
+
+    # Read page-ID-title data
+    if not path.isfile(PAGE_ID_TITLE_RAW_FILE):  # Read SQL and write cache
+        title_to_id = read_page_sql(args.path_page_sql_gz, workers=args.workers)
+        write_page_id_title_raw(title_to_id, PAGE_ID_TITLE_RAW_FILE)
+    else:  # Read cache
+        title_to_id = read_page_id_title_raw(PAGE_ID_TITLE_RAW_FILE)
+
+    # Read page-links data
+    if not path.isfile(PAGE_LINKS_RAW_FILE):
+        links = read_pagelinks_sql(args.path_pagelinks_sql_gz, title_to_id, workers=args.workers)
+        write_page_links_raw(links, PAGE_LINKS_RAW_FILE)
+
+
+if __name__ == "__main__":
+    main()
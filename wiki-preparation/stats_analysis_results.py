@@ -5,19 +5,32 @@ import random
 from tqdm import tqdm
 import argparse
 from typing import List
-from json import JSONEncoder, dumps
+from multiprocessing import Pool
+from json import JSONEncoder, dumps, loads
 
-from wikipediaapi import Wikipedia
+from corpus_store import CorpusStore, page_key
+from paragraph_table import ParagraphTable
+from sections import END_SECTION_TITLES, LIST_TAG, get_subsections_text
+
+# Worker-side arguments of export_article, set once per process by _init_export_worker
+_export_kwargs = None
 
 
 class Paragraph:
+    __slots__ = ['context', 'qas']
+
     def __init__(self,
                  context: str):
         self.context = context
         self.qas = []
 
+    def to_dict(self):
+        return {'context': self.context, 'qas': self.qas}
+
 
 class Article:
+    __slots__ = ['title', 'paragraphs', 'oldid']
+
     def __init__(self,
                  title: str,
                  paragraphs: List[str],
@@ -26,10 +39,15 @@ class Article:
         self.paragraphs = [Paragraph(p) for p in paragraphs]
         self.oldid = oldid
 
+    def to_dict(self):
+        return {'title': self.title, 'paragraphs': self.paragraphs, 'oldid': self.oldid}
+
 
 class Dataset:
     class CustomEncoder(JSONEncoder):
         def default(self, o):
+            if hasattr(o, 'to_dict'):
+                return o.to_dict()
             return o.__dict__
 
     def __init__(self,
@@ -42,6 +60,43 @@ class Dataset:
         return dumps(self, indent=4, cls=self.CustomEncoder)
 
 
+class DatasetWriter:
+    """
+    Writes the same JSON as Dataset.to_json, one article at a time, so that the articles do not have to be
+    kept in memory. With indent=None, the JSON is written on a single line.
+    """
+
+    def __init__(self,
+                 f,
+                 version: str = 'frenchqa_1.0',
+                 indent: int = 4):
+        self.f = f
+        self.version = version
+        self.indent = indent
+        self.nb_articles = 0
+
+    def _newline(self, level):
+        return '\n' + ' ' * (self.indent * level) if self.indent is not None else ''
+
+    def __enter__(self):
+        self.f.write('{' + self._newline(1) + '"data": [')
+        return self
+
+    def write(self, article: Article):
+        article_json = dumps(article, indent=self.indent, cls=Dataset.CustomEncoder)
+        if self.indent is not None:
+            article_json = article_json.replace('\n', self._newline(2))
+        separator = ',' if self.indent is not None else ', '
+        self.f.write((separator if self.nb_articles else '') + self._newline(2) + article_json)
+        self.nb_articles += 1
+
+    def __exit__(self, *exc):
+        end_data = self._newline(1) + ']' if self.nb_articles else ']'
+        separator = ',' if self.indent is not None else ', '
+        self.f.write(end_data + separator + self._newline(1) + '"version": ' + dumps(self.version) +
+                     self._newline(0) + '}')
+
+
 def check_number_paragraphs(article_stats, min_len_paragraphs=500, max_len_paragraphs=1000):
     if article_stats['total_text_length'] < min_len_paragraphs:
         return []
@@ -95,53 +150,48 @@ def filter_min_paras(stats_with_para_len, min_nb_paras):
     return filtered_dic
 
 
-def get_section_text(section, level=1):
-    s_text = ''
-    for s in section.sections:
-        s_text += s.text
-        s_text += '\n' + get_section_text(s, level + 1)
-    return s_text
-
+def load_pages(page_pkl_fn, wiki_path=None, html_path=None, corpus=None):
+    # Returns the wiki page and the html page (None if there is no html path) of an article
+    if corpus is not None:
+        page_html = corpus.page(page_pkl_fn, 'html') if corpus.has(page_pkl_fn, 'html') else None
+        return corpus.page(page_pkl_fn, 'wiki'), page_html
 
-def filter_years_articles(page_pkl_fn):
-    # If 'Evenements' is in sections title, then it means it is a year article.
-    with open(page_pkl_fn, 'rb') as f:
-        page = pkl.load(f)
-
-    for section in page.sections:
-        if section.title in ['Événements']:
-            return False
-        return True
-
-
-def get_section_paragraphs_text(page_pkl_fn, min_len_para=500, max_len_para=1000, wiki_path=None, html_path=None):
     if wiki_path is None:
         wiki_path = ''
     with open(wiki_path + '/' + page_pkl_fn, 'rb') as f:
         page = pkl.load(f)
 
+    page_html = None
     if html_path is not None:
         with open(html_path + '/' + page_pkl_fn, 'rb') as f:
             page_html = pkl.load(f)
+    return page, page_html
+
+
+def get_section_paragraphs_text(page_pkl_fn, min_len_para=500, max_len_para=1000, wiki_path=None, html_path=None,
+                                corpus=None):
+    page, page_html = load_pages(page_pkl_fn, wiki_path, html_path, corpus)
+    return get_page_paragraphs_text(page, page_html, min_len_para, max_len_para)
+
+
+def get_page_paragraphs_text(page, page_html=None, min_len_para=500, max_len_para=1000):
 
     paragraphs = [paragraph for paragraph in page.summary.split('\n') if
                   len(paragraph) >= min_len_para and len(paragraph) < max_len_para]
     for i, section in enumerate(page.sections):
-        if section.title in ['Voir aussi', 'Articles connexes', 'Liens externes', 'Notes et références']:
+        if section.title in END_SECTION_TITLES:
             break
 
         # We check if the section contains lists 
-        if html_path is not None and '<li>' in page_html.sections[i].text:
+        if page_html is not None and LIST_TAG in page_html.sections[i].text:
             current_section_text = ''
-            new_html_section_text = get_section_text(page_html.sections[i])
+            new_section_text = get_subsections_text(section, page_html.sections[i])
         else:
             current_section_text = section.text + '\n'
-            new_html_section_text = current_section_text
-
-        if html_path is not None and '<li>' in new_html_section_text:
-            new_section_text = ''
-        else:
-            new_section_text = get_section_text(section)
+            if page_html is not None and LIST_TAG in current_section_text:
+                new_section_text = ''
+            else:
+                new_section_text = get_subsections_text(section)
 
         section_text = current_section_text + new_section_text
 
@@ -151,48 +201,112 @@ def get_section_paragraphs_text(page_pkl_fn, min_len_para=500, max_len_para=1000
     return paragraphs
 
 
-def get_filtered_complete_dic(pkl_with_stats_fn, min_paragraphs=5, min_len_paragraphs=500, max_len_paragraphs=1000,
-                              draft=False, homonym=False, years=False, wiki_path=None, clean_duplicates=False):
+def get_stats_paragraphs_text(article_stats, min_len_para=500, max_len_para=1000):
+    # Same paragraphs as the ones counted by check_number_paragraphs, taken from the stats instead of the pages
+    flatten_section = [para for section in article_stats['paragraph_by_sections'] for para in section]
+    return [paragraph for paragraph in article_stats['paragraphs_in_summary'] + flatten_section if
+            len(paragraph) >= min_len_para and len(paragraph) < max_len_para]
+
+
+def load_stats(pkl_with_stats_fn):
     with open(pkl_with_stats_fn, 'rb') as f:
-        stats_uncleaned = pkl.load(f)
+        return pkl.load(f)
+
+
+def export_article(article_fn, article_stats=None, min_len_para=500, max_len_para=1000, wiki_path=None,
+                   html_path=None, corpus=None):
+    """
+    Returns the Article of a selected article, from its stats or, for stats computed before the revisions were
+    kept, from its pages, each one being loaded once. Returns None if its pages are missing.
+    """
+    filename = article_fn.split('/')[-1]
+    if isinstance(article_stats, dict) and 'lastrevid' in article_stats:
+        paragraphs = get_stats_paragraphs_text(article_stats, min_len_para, max_len_para)
+        oldid = article_stats['lastrevid']
+    else:
+        try:
+            page, page_html = load_pages(article_fn, wiki_path, html_path, corpus)
+        except (FileNotFoundError, KeyError):
+            # File may have been deleted already because it was a duplicate
+            return None
+        paragraphs = get_page_paragraphs_text(page, page_html, min_len_para, max_len_para)
+        oldid = page.lastrevid
+
+    filename = filename.replace('_', ' ')
+    filename = filename.replace('.pkl', '')
+    return Article(filename, paragraphs, oldid=str(oldid))
+
+
+def _init_export_worker(min_len_para, max_len_para, wiki_path, html_path, corpus_path):
+    global _export_kwargs
+    _export_kwargs = {'min_len_para': min_len_para, 'max_len_para': max_len_para, 'wiki_path': wiki_path,
+                      'html_path': html_path,
+                      'corpus': CorpusStore(corpus_path) if corpus_path is not None else None}
+
+
+def _export_task(task):
+    article_fn, article_stats = task
+    return export_article(article_fn, article_stats, **_export_kwargs)
+
+
+def export_articles(articles_filename, all_stats, min_len_para=500, max_len_para=1000, wiki_path=None,
+                    html_path=None, corpus_path=None, workers=1):
+    """
+    Yields the Article of each of articles_filename, in the same order. With several workers, the articles are
+    exported by a pool of processes.
+    """
+    initargs = (min_len_para, max_len_para, wiki_path, html_path, corpus_path)
+    tasks = ((article_fn, all_stats.get(article_fn)) for article_fn in articles_filename)
+    if workers <= 1:
+        _init_export_worker(*initargs)
+        yield from map(_export_task, tasks)
+        return
+
+    with Pool(workers, initializer=_init_export_worker, initargs=initargs) as pool:
+        yield from pool.imap(_export_task, tasks, chunksize=16)
+
+
+def load_canonical_titles(canonical_titles_fn):
+    with open(canonical_titles_fn, encoding='utf-8') as f:
+        return loads(f.read())
 
-    # We filter out the sections errors    
-    stats = {key: stats_uncleaned[key] for key in stats_uncleaned if stats_uncleaned[key] != 'SectionError'}
 
-    filtered_stats = filter_dic(stats, min_len_paragraphs=min_len_paragraphs, draft=draft, homonym=homonym,
-                                max_len_paragraphs=max_len_paragraphs)
-    filtered_stats = filter_min_paras(filtered_stats, min_paragraphs)
+def get_filtered_complete_dic(pkl_with_stats_fn, min_paragraphs=5, min_len_paragraphs=500, max_len_paragraphs=1000,
+                              draft=False, homonym=False, years=False, clean_duplicates=False, stats_uncleaned=None,
+                              canonical_titles=None):
+    if stats_uncleaned is None:
+        stats_uncleaned = load_stats(pkl_with_stats_fn)
 
-    # We filter the years
+    # The articles with errors are left out of the table
+    table = ParagraphTable.from_stats(stats_uncleaned)
 
+    filtered_stats = table.filter(min_paragraphs, min_len_paragraphs=min_len_paragraphs,
+                                  max_len_paragraphs=max_len_paragraphs, draft=draft, homonym=homonym)
+    year_filenames = {filename for filename, is_year in zip(table.keys, table.is_year) if is_year}
+
+    # Duplicates are merged under the canonical title of the page, from the index written by dump.py
     if clean_duplicates:
-        if wiki_path is None:
-            print("Error : give a wikipath for duplicates cleaning")
+        if canonical_titles is None:
+            print("Error : give the canonical titles for duplicates cleaning")
             return
         new_ft_stats = {}
-        wiki_obj = Wikipedia('fr')
         for filename, stats in filtered_stats.items():
-            try:
-                with open(wiki_path + '/' + filename, 'rb') as f:
-                    page = pkl.load(f)
-            except FileNotFoundError:
+            extension = '.pkl' if filename.endswith('.pkl') else ''
+            title = canonical_titles.get(filename[:len(filename) - len(extension)])
+            if title is None:
                 print("Not found :" + filename)
                 continue
-            page_info = wiki_obj.info(page)
-            new_title = title = page_info.title
-            new_title = new_title.replace(' ', '_')
-            new_title += '.pkl'
+            new_title = page_key(title) + extension
+            if filename in year_filenames:
+                year_filenames.add(new_title)
             new_ft_stats[new_title] = stats
         filtered_stats = new_ft_stats
 
+    # We filter the years
     if not years:
         print("Length before year fitering :", len(filtered_stats))
-        if wiki_path is None:
-            filtered_stats = {filename: filtered_stats[filename] for filename in filtered_stats if
-                              filter_years_articles(filename)}
-        else:
-            filtered_stats = {filename: filtered_stats[filename] for filename in filtered_stats if
-                              filter_years_articles(wiki_path + filename)}
+        filtered_stats = {filename: filtered_stats[filename] for filename in filtered_stats if
+                          filename not in year_filenames}
     print("Final length : ", len(filtered_stats))
     return filtered_stats
 
@@ -218,49 +332,51 @@ def main():
     parser.add_argument("--nb_articles_to_print", default=None, type=int, required=False,
                         help="Number of articles to print if output_json_article_fn is not None")
 
-    parser.add_argument("--wiki_path", default=None, type=str, required=True,
-                        help="Path to where the wiki pages are saved")
-    parser.add_argument("--html_path", default=None, type=str, required=True,
-                        help="Path to where the html pages are saved")
+    parser.add_argument("--wiki_path", default=None, type=str, required=False,
+                        help="Path to where the wiki pages are saved, only read for stats computed without the "
+                             "revisions of the articles")
+    parser.add_argument("--html_path", default=None, type=str, required=False,
+                        help="Path to where the html pages are saved, only read for stats computed without the "
+                             "revisions of the articles")
+    parser.add_argument("--corpus_path", default=None, type=str, required=False,
+                        help="Corpus store where the pages are saved, instead of --wiki_path and --html_path")
+    parser.add_argument("--seed", default=None, type=int, required=False,
+                        help="Seed of the shuffle of the articles, to export them in the same order")
+    parser.add_argument("--workers", default=1, type=int, required=False,
+                        help="Number of processes exporting the articles")
+    parser.add_argument("--no_indent", action='store_true',
+                        help="Write the json file on a single line instead of indenting it")
+    parser.add_argument("--canonical_titles_fn", default=None, type=str, required=False,
+                        help="canonical_titles.json written by dump.py, to merge the duplicated articles")
 
     args = parser.parse_args()
 
+    all_stats = load_stats(args.pkl_stats_dic_fn)
+    canonical_titles = None
+    if args.canonical_titles_fn is not None:
+        canonical_titles = load_canonical_titles(args.canonical_titles_fn)
     stats = get_filtered_complete_dic(args.pkl_stats_dic_fn, min_paragraphs=args.min_paragraphs,
                                       min_len_paragraphs=args.min_len_paragraphs,
                                       max_len_paragraphs=args.max_len_paragraphs, draft=False, homonym=False,
-                                      years=True, wiki_path=args.wiki_path, clean_duplicates=False)
+                                      years=True, clean_duplicates=canonical_titles is not None,
+                                      stats_uncleaned=all_stats, canonical_titles=canonical_titles)
 
     if args.output_json_article_fn is not None:
 
         articles_filename = list(stats.keys())
-        random.shuffle(articles_filename)
+        random.Random(args.seed).shuffle(articles_filename)
 
         if args.nb_articles_to_print is not None:
             articles_filename = articles_filename[:args.nb_articles_to_print]
 
-        articles_list = []
-        for article_fn in tqdm(articles_filename):
-            try:
-                paragraphs = get_section_paragraphs_text(article_fn, min_len_para=args.min_len_paragraphs,
-                                                         max_len_para=args.max_len_paragraphs, wiki_path=args.wiki_path,
-                                                         html_path=args.html_path)
-                filename = article_fn.split('/')[-1]
-            except FileNotFoundError:
-                continue
-                # File may have been deleted already because it was a duplicate
-
-            with open(args.wiki_path + '/' + filename, 'rb') as f:
-                page = pkl.load(f)
-
-            filename = filename.replace('_', ' ')
-            filename = filename.replace('.pkl', '')
-
-            articles_list.append(Article(filename, paragraphs, oldid=str(page.lastrevid)))
-
-        dataset = Dataset(articles_list)
-
-        with open(args.output_json_article_fn, 'w') as f:
-            f.write(dataset.to_json())
+        indent = None if args.no_indent else 4
+        articles = export_articles(articles_filename, all_stats, min_len_para=args.min_len_paragraphs,
+                                   max_len_para=args.max_len_paragraphs, wiki_path=args.wiki_path,
+                                   html_path=args.html_path, corpus_path=args.corpus_path, workers=args.workers)
+        with open(args.output_json_article_fn, 'w') as f, DatasetWriter(f, indent=indent) as writer:
+            for article in tqdm(articles, total=len(articles_filename)):
+                if article is not None:
+                    writer.write(article)
 
 
 if __name__ == "__main__":
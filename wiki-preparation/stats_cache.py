@@ -0,0 +1,92 @@
+"""
+Incremental cache of the article stats computed by compute_wiki_stats.py, in a sqlite database.
+
+Each row holds the pickled stats of one article together with the signature of its source: the version of the
+stats extractor and the size and modification time of its pickle files, or the position and revision of its
+records in a corpus store. Only the articles whose signature changed have to be computed again, and the stats
+of the others are only unpickled when they are accessed.
+"""
+
+import pickle as pkl
+import sqlite3
+from collections.abc import Mapping
+from os import path, stat
+
+# To be increased whenever compute_page changes its output, so that the cached stats are computed again
+STATS_VERSION = 2
+
+
+def file_signature(file_path):
+    file_stat = stat(file_path)
+    return f"{path.abspath(file_path)}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+
+
+def page_signature(key, folder_path=None, html_path=None, corpus=None):
+    """
+    Signature of the sources of the stats of an article, from a corpus store or from its pickle files.
+    """
+    if corpus is not None:
+        parts = []
+        for extract_format in ['wiki', 'html']:
+            if corpus.has(key, extract_format):
+                page = corpus.page(key, extract_format)
+                # Updated pages are appended to the store, so their offset changes
+                parts.append(f"{extract_format}:{page.offset}:{page.lastrevid}")
+    else:
+        parts = [file_signature(folder_path + '/' + key)]
+        if html_path is not None:
+            parts.append(file_signature(html_path + '/' + key))
+    return f"v{STATS_VERSION}|" + '|'.join(parts)
+
+
+class StatsCache(Mapping):
+    def __init__(self, cache_path):
+        self.path = cache_path
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS stats "
+                                "(key TEXT PRIMARY KEY, signature TEXT NOT NULL, stats BLOB NOT NULL)")
+
+    def signatures(self):
+        return dict(self.connection.execute("SELECT key, signature FROM stats"))
+
+    def stale_keys(self, signatures):
+        """
+        Keys of the {key: signature} dict that are missing from the cache or cached with another signature.
+        """
+        cached = self.signatures()
+        return [key for key, signature in signatures.items() if cached.get(key) != signature]
+
+    def update(self, stats_by_key, signatures):
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO stats VALUES (?, ?, ?)",
+                                        [(key, signatures[key], pkl.dumps(stats, protocol=pkl.HIGHEST_PROTOCOL))
+                                         for key, stats in stats_by_key.items()])
+
+    def get_many(self, keys):
+        """
+        Returns the {key: stats} of the given keys that are cached, read with a single scan of the table.
+        """
+        keys = set(keys)
+        return {key: pkl.loads(stats) for key, stats in self.connection.execute("SELECT key, stats FROM stats")
+                if key in keys}
+
+    def __getitem__(self, key):
+        row = self.connection.execute("SELECT stats FROM stats WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pkl.loads(row[0])
+
+    def __iter__(self):
+        return (key for key, in self.connection.execute("SELECT key FROM stats"))
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM stats").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
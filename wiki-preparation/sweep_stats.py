@@ -0,0 +1,75 @@
+import argparse
+import time
+
+from paragraph_table import ParagraphTable
+from stats_analysis_results import load_stats
+
+
+def int_list(text):
+    return [int(value) for value in text.split(',')]
+
+
+def sweep(table, min_paragraphs_list, min_len_list, max_len_list, draft=False, homonym=False, years=True):
+    """
+    Returns one (min_paragraphs, min_len_paragraphs, max_len_paragraphs, nb_articles, nb_paragraphs) row per
+    combination of thresholds, with the same filters as get_filtered_complete_dic.
+    """
+    # Only depend on the category and year filters
+    article_mask = (table.draft == draft) & (table.homonym == homonym)
+    if not years:
+        article_mask &= ~table.is_year
+
+    rows = []
+    for min_len in min_len_list:
+        for max_len in max_len_list:
+            # The paragraphs kept by article are counted once for all the values of min_paragraphs
+            counts = table.count_by_article(table.paragraph_mask(min_len, max_len))
+            counts[~article_mask] = -1
+            for min_paragraphs in min_paragraphs_list:
+                kept = counts >= min_paragraphs
+                rows.append((min_paragraphs, min_len, max_len, int(kept.sum()), int(counts[kept].sum())))
+    return rows
+
+
+def print_rows(rows, output_tsv_fn=None):
+    header = ('min_paragraphs', 'min_len_paragraphs', 'max_len_paragraphs', 'nb_articles', 'nb_paragraphs')
+    lines = ['\t'.join(header)] + ['\t'.join(str(value) for value in row) for row in rows]
+    print('\n'.join(lines))
+    if output_tsv_fn is not None:
+        with open(output_tsv_fn, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    ## Required parameters
+    parser.add_argument("--pkl_stats_dic_fn", default=None, type=str, required=True,
+                        help="Pkl file where the stats are already dumped")
+
+    parser.add_argument("--min_paragraphs", default=[5], type=int_list, required=False,
+                        help="Comma-separated values of the minimum number of paragraphs per article")
+
+    parser.add_argument("--min_len_paragraphs", default=[500], type=int_list, required=False,
+                        help="Comma-separated values of the minimum len of paragraphs")
+
+    parser.add_argument("--max_len_paragraphs", default=[1000], type=int_list, required=False,
+                        help="Comma-separated values of the max len of paragraphs")
+
+    parser.add_argument("--output_tsv_fn", default=None, type=str, required=False,
+                        help="Tab-separated file where the table of counts is also written")
+
+    args = parser.parse_args()
+
+    start_time = time.time()
+    table = ParagraphTable.from_stats(load_stats(args.pkl_stats_dic_fn))
+    print(f"Loaded {len(table)} articles and {len(table.lengths)} paragraphs ({time.time() - start_time:.3f} s)")
+
+    start_time = time.time()
+    rows = sweep(table, sorted(args.min_paragraphs), sorted(args.min_len_paragraphs),
+                 sorted(args.max_len_paragraphs))
+    print(f"Evaluated {len(rows)} combinations ({time.time() - start_time:.3f} s)")
+    print_rows(rows, args.output_tsv_fn)
+
+
+if __name__ == "__main__":
+    main()
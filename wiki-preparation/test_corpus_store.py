@@ -0,0 +1,54 @@
+import sys
+from os import path
+
+import pytest
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+
+from corpus_store import INDEX_SUFFIX, CorpusStore, CorpusWriter
+
+
+class Page:
+    def __init__(self, title):
+        self.title = title
+        self.lastrevid = len(title)
+        self.categories = ['Catégorie:Test']
+        self.summary = f"Résumé de {title}"
+        self.sections = []
+
+
+@pytest.mark.parametrize('cut_index', [b'Article_3\twiki\t4', b'Article_3\twi', b'Article_3\n'])
+def test_interrupted_index(tmp_path, cut_index):
+    corpus_path = str(tmp_path / 'corpus.bin')
+    with CorpusWriter(corpus_path) as writer:
+        for i in range(3):
+            writer.append(Page(f"Article {i}"), 'wiki')
+    # An interrupted writer leaves the last index line incomplete
+    with open(corpus_path + INDEX_SUFFIX, 'ab') as f:
+        f.write(cut_index)
+
+    store = CorpusStore(corpus_path)
+    assert sorted(store.keys()) == ['Article_0', 'Article_1', 'Article_2']
+    assert store.page('Article_2').summary == "Résumé de Article 2"
+
+    with CorpusWriter(corpus_path) as writer:
+        assert not writer.has('Article_3', 'wiki')
+        writer.append(Page("Article 3"), 'wiki')
+    store = CorpusStore(corpus_path)
+    assert sorted(store.keys()) == ['Article_0', 'Article_1', 'Article_2', 'Article_3']
+    assert store.page('Article_3').title == "Article 3"
+
+
+def test_malformed_index_line(tmp_path):
+    corpus_path = str(tmp_path / 'corpus.bin')
+    with CorpusWriter(corpus_path) as writer:
+        writer.append(Page("Article 0"), 'wiki')
+    with open(corpus_path + INDEX_SUFFIX, 'ab') as f:
+        f.write(b'Article_1\twiki\n')
+    with CorpusWriter(corpus_path) as writer:
+        writer.append(Page("Article 2"), 'wiki')
+    # Only the last line may be incomplete
+    with open(corpus_path + INDEX_SUFFIX, 'ab') as f:
+        f.write(b'Article_1\twiki\nArticle_3\twiki\t0\n')
+    with pytest.raises(ValueError):
+        CorpusStore(corpus_path)
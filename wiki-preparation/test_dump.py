@@ -0,0 +1,95 @@
+import pickle as pkl
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from os import path
+from pathlib import Path
+
+import pytest
+import requests
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+
+import dump
+from fake_wiki_api import FakeWikiHandler, REDIRECT_SUFFIX
+
+
+@pytest.fixture
+def api_url():
+    server = ThreadingHTTPServer(('localhost', 0), FakeWikiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_address[1]}/w/api.php"
+    server.shutdown()
+    server.server_close()
+
+
+def test_write_pickle_concurrent_writers(tmp_path):
+    target_file = tmp_path / 'Article.pkl'
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [executor.submit(dump.write_pickle, i, target_file) for i in range(64)]:
+            future.result()
+    assert pkl.loads(target_file.read_bytes()) in range(64)
+    assert [f.name for f in tmp_path.iterdir()] == ['Article.pkl']
+
+
+def test_dump_concurrent_batches_with_redirects(tmp_path, monkeypatch, api_url):
+    # Each article is listed with its redirect, so that concurrent batches resolve to the same pages
+    titles = [f"Article {i}" for i in range(40)]
+    sources = [title + suffix for title in titles for suffix in ('', REDIRECT_SUFFIX)]
+    top_pkl = tmp_path / 'top.pkl'
+    with top_pkl.open('wb') as f:
+        pkl.dump([(0, source) for source in sources + sources[:10]], f)
+
+    monkeypatch.chdir(tmp_path)
+    dump.main(str(top_pkl), workers=8, api_url=api_url, batch_size=1)
+
+    for folder in ['data/10khtml', 'data/10kpages']:
+        files = sorted(f.name for f in Path(folder).iterdir() if f.name.endswith('.pkl'))
+        assert files == sorted(dump.page_key(title) + '.pkl' for title in titles)
+        assert not list(Path(folder).glob('.*' + dump.PARTIAL_SUFFIX))
+
+        manifest = dump.Manifest(Path(folder) / 'manifest.jsonl')
+        assert set(manifest.entries) == set(sources)
+        for source in sources:
+            entry = manifest.get(source)
+            assert entry['title'] == source.replace(REDIRECT_SUFFIX, '')
+            assert manifest.is_dumped(source)
+
+
+class TruncatingWikiHandler(FakeWikiHandler):
+    # Answers the first requests with a body cut in the middle, as an interrupted response
+    truncated = 0
+
+    def do_GET(self):
+        if TruncatingWikiHandler.truncated > 0:
+            TruncatingWikiHandler.truncated -= 1
+            body = b'{"query": {"pages": {"1'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+
+@pytest.mark.parametrize('truncated, max_retries, fails', [(2, 2, False), (3, 2, True)])
+def test_invalid_json_is_retried(monkeypatch, truncated, max_retries, fails):
+    server = ThreadingHTTPServer(('localhost', 0), TruncatingWikiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(TruncatingWikiHandler, 'truncated', truncated)
+    wiki = dump.ThrottledWikipedia('fr', api_url=f"http://localhost:{server.server_address[1]}/w/api.php",
+                                   max_retries=max_retries, backoff=0)
+    try:
+        if fails:
+            with pytest.raises(requests.RequestException):
+                wiki.query_pages(['Article 1'], prop='info')
+        else:
+            resolved, pages = wiki.query_pages(['Article 1'], prop='info')
+            assert resolved == {'Article 1': 'Article 1'}
+            assert 'lastrevid' in pages['Article 1']
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,41 @@
+import sys
+from os import path
+
+import pytest
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+
+from sql_dump import parse_tuples
+
+
+@pytest.mark.parametrize('values_text, expected', [
+    ("", []),
+    ("(1,0,'Paris',NULL,0.5)", [[1, 0, 'Paris', None, 0.5]]),
+    ("(1,'L\\'Étranger'),(2,'a\\\\b'),(3,'(,)')", [[1, "L'Étranger"], [2, 'a\\b'], [3, '(,)']]),
+    ("(1, -2), (3e2, '')", [[1, -2], [300.0, '']]),
+    ("()", [[]]),
+])
+def test_parse_tuples(values_text, expected):
+    assert parse_tuples(values_text) == expected
+
+
+@pytest.mark.parametrize('values_text', [
+    "(1 2)",
+    "(3,,4)",
+    "(1)(2)",
+    "(1 2)(3,,4)",
+    "(1,)",
+    "(,1)",
+    "(1),",
+    ",(1)",
+    "(1),x(3)",
+    "(1,'ab),(2)",
+    "(1,2",
+    "1,(2)",
+    "(1,(2))",
+    "(1,2))",
+    "(1,@)",
+])
+def test_parse_tuples_malformed(values_text):
+    with pytest.raises(ValueError):
+        parse_tuples(values_text)